@@ -6,21 +6,46 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 import serial
 import time
-import struct
 import threading
 import csv
 import os
-
-# Register address dictionary (example, adjust as needed)
-regdict = {
-    'ID': 2, 'baudrate': 12, 'curLocat': 26, 'zeroCalibra': 31, 'overCurproSet': 32,
-    'tarLocatSet': 55, 'fSensorDada': 76, 'fOriginalValue': 78, 'forceAct': 98, 'warmUpSta': 100
-}
+import argparse
+import functools
+import queue
+import numpy as np
+from concurrent.futures import CancelledError
+from flesh import Hand
+from flesh.emulator import EmulatedPort
+from flesh.replay import Replay
+from flesh.worker import IOWorker, PRIORITY_STOP, PRIORITY_MOTION, PRIORITY_TELEMETRY
+from flesh.jog import TargetBuffer
+from flesh.telemetry import TelemetryRing, decimate_minmax
+from flesh.poller import AdaptivePoller
+from flesh.trajectory import TransitionTable
+from flesh.sequence import compile_sequence
+from flesh.motion import watch
+from flesh import metrics, trace
 
 # Global variables
 MIN_POS = 25
 MAX_POS = 1775
-ser = None
+STATUS_BUDGET = 250  # Status polls per second the bus may spend on telemetry
+STATUS_FAST_PERIOD = 0.02  # Poll period of moving or loading actuators
+STATUS_SLOW_PERIOD = 0.5  # Heartbeat of settled actuators
+METRICS_PORT = 9464  # Serial I/O metrics on http://127.0.0.1:9464/metrics (Prometheus) and /snapshot, None to disable
+GUI_FPS = 30  # Cap on status display refreshes per second, telemetry in between is coalesced
+CHART_FPS = 10  # Strip chart redraws per second
+CHART_WINDOW = 10.0  # Seconds of history in the strip charts
+CHART_WIDTH = 360  # Strip chart size in pixels, history is decimated to one min/max pair per column
+CHART_HEIGHT = 120
+CHART_FIELDS = (('pos', 'Position'), ('current', 'Current (mA)'), ('force', 'Force'))
+CHART_COLORS = ('#4A90E2', '#D0021B', '#7ED321', '#F5A623', '#9013FE')  # Actuators 1 to 5
+JOG_PERIOD = 0.02  # Control tick for jog commands, key release to stop is bounded by one tick
+TRAJECTORY_RATE = 50  # Broadcast frames per second while streaming a trajectory
+GESTURE_DURATION = None  # Seconds per gesture transition, None for as fast as GESTURE_MAX_SPEED allows
+GESTURE_MAX_SPEED = (2500, 2500, 2500, 2500, 2500)  # Speed limit of actuators 1 to 5 during gestures, position counts per second
+GESTURE_TIMEOUT = 2.0  # Seconds past the end of a transition an actuator may take to reach or grip before the gesture is stopped anyway
+hand = None  # Connection handle, only used on the I/O thread
 actuator_positions = {id: MIN_POS for id in range(1, 6)}  # Initial target positions
 gestures = []  # List to store up to 10 gestures
 pos_labels = {}
@@ -29,117 +54,96 @@ current_labels = {}
 force_labels = {}
 gesture_listbox = None
 mode_var = None  # Variable to track jogging mode (0: normal, 1: micro)
-serial_lock = threading.Lock()  # Lock for serial port access
-
-# Serial port setup
-def openSerial(port, baudrate):
-    ser = serial.Serial()
-    ser.port = port
-    ser.baudrate = baudrate
-    ser.timeout = 1  # Read timeout
-    ser.write_timeout = 1  # Write timeout
-    ser.open()
-    return ser
-
-# Write register (example, adjust as needed)
-def writeRegister(ser, id, add, num, val):
-    with serial_lock:
-        bytes = [0x55, 0xAA, num + 2, id, 0x02, add]
-        for i in range(num):
-            bytes.append(val[i])
-        checksum = sum(bytes[2:]) & 0xFF
-        bytes.append(checksum)
-        try:
-            ser.write(bytes)
-            time.sleep(0.01)
-            ser.read_all()
-        except serial.SerialTimeoutException:
-            print(f"Write timeout in writeRegister for actuator {id}")
-
-# Read register (example, adjust as needed)
-def readRegister(ser, id, add, num, mute=False):
-    with serial_lock:
-        bytes = [0x55, 0xAA, num + 2, id, 0x01, add, num]
-        checksum = sum(bytes[2:]) & 0xFF
-        bytes.append(checksum)
-        try:
-            ser.write(bytes)
-            time.sleep(0.01)
-            recv = ser.read_all()
-            if len(recv) == 0:
-                return []
-            num = (recv[2] & 0xFF) - 2
-            val = [recv[6 + i] for i in range(num)]
-            if not mute:
-                print('Read register values:', val)
-            return val
-        except serial.SerialTimeoutException:
-            print(f"Write timeout in readRegister for actuator {id}")
-            return []
-
-# Query actuator status
-def control(ser, id):
-    command = [0x55, 0xAA, 0x03, id, 0x04, 0x00, 0x22]
-    checksum = sum(command[2:]) & 0xFF
-    command.append(checksum)
-    with serial_lock:
-        try:
-            ser.write(bytes(command))
-            time.sleep(0.01)
-            response = ser.read(22)
-            if len(response) == 22 and response[0] == 0xAA and response[1] == 0x55:
-                calc_checksum = sum(response[2:21]) & 0xFF
-                if calc_checksum == response[21]:
-                    current_pos = struct.unpack('<h', response[9:11])[0]
-                    temp = struct.unpack('<b', response[11:12])[0]
-                    current = struct.unpack('<H', response[12:14])[0]
-                    force = struct.unpack('<h', response[14:16])[0]
-                    return current_pos, temp, current, force
-        except serial.SerialTimeoutException:
-            print(f"Write timeout in control for actuator {id}")
-    return None
-
-# Broadcast position command for 5 actuators
-def broadcast(ser, num, val1, val2, val3, val4, val5):
-    bytes = [0x55, 0xAA, 1 + num * 3, 0xff, 0xf2]
-    actuator_values = [val1, val2, val3, val4, val5]
-    for i, val in enumerate(actuator_values):
-        bytes.append(i + 1)
-        bytes.append(val & 0xFF)
-        bytes.append((val >> 8) & 0xFF)
-    checksum = sum(bytes[2:]) & 0xFF
-    bytes.append(checksum)
-    with serial_lock:
-        try:
-            ser.write(bytes)
-            time.sleep(0.01)
-        except serial.SerialTimeoutException:
-            print("Write timeout in broadcast")
+io_worker = None  # I/O thread that owns the serial port, every command goes through it
+jog_buffer = None  # Coalesces key-repeat jogs into at most one broadcast per control tick
+telemetry = TelemetryRing()  # Status history per actuator, written only by the status thread
+status_poller = AdaptivePoller(budget=STATUS_BUDGET, fast_period=STATUS_FAST_PERIOD, slow_period=STATUS_SLOW_PERIOD)
+status_queue = queue.SimpleQueue()  # Status sweeps from the status thread to the GUI thread
+label_text = {}  # Text currently shown by each status label, so unchanged values are not redrawn
+refresh_stats = {kind: {'ticks': 0, 'updates': 0, 'seconds': 0.0, 'max': 0.0} for kind in ('labels', 'charts')}  # Cost of the GUI refresh ticks
+charts = {}  # Field -> strip chart canvas, line items and value range
+chart_drawn = {}  # (field, id) -> sample count and time span the line was last drawn for
+transitions = TransitionTable(GESTURE_MAX_SPEED, GESTURE_DURATION, TRAJECTORY_RATE)  # Precompiled moves between stored gestures
+gesture_stop = threading.Event()  # Set to cut the running gesture short when another motion command comes in
+dance_stop = threading.Event()  # Same for the running dance
+
+# Serial I/O runs on the I/O thread, which owns the Hand; GUI code queues commands through these
+
+# Cut a gesture or dance still streaming short, so its remaining frames do not overwrite a new command
+def cut_streams():
+    gesture_stop.set()
+    dance_stop.set()
+
+# Queue a broadcast of the 5 target positions as a motion command
+def move(*positions):
+    cut_streams()
+    if trace.enabled:
+        trace.instant('move', 'app', positions=list(positions))
+    if jog_buffer is not None:
+        jog_buffer.sync(positions)
+    return send_targets(positions)
+
+# Queue a broadcast that preempts everything and cancels motion still waiting in the queue
+def stop(*positions):
+    status_poller.set_targets(positions)
+    return io_worker.submit(PRIORITY_STOP, Hand.broadcast, *positions)
+
+# Queue a motion broadcast and let the status poller follow the new targets, also used by the jog buffer
+def send_targets(positions):
+    status_poller.set_targets(positions)
+    return io_worker.submit(PRIORITY_MOTION, Hand.broadcast, *positions)
+
+# Stream compiled frames (a trajectory's FrameStream or a CompiledSequence) through the I/O thread
+# until the end or until stop is set, returns once the last frame is queued
+def play_stream(stream, stop=None):
+    final = stream.targets[-1].tolist()
+    status_poller.set_targets(final)
+    stats = stream.play(lambda frame: io_worker.submit(PRIORITY_MOTION, Hand.send_frame, frame), stop)
+    if stop is not None and stop.is_set():
+        return stats  # Superseded, whatever cut it short owns the targets now
+    for id, pos in enumerate(final, start=1):
+        actuator_positions[id] = pos
+    if jog_buffer is not None:
+        jog_buffer.sync(final)
+    return stats
+
+# Queue a status sweep (all actuators by default), returns a Future for {id: Status or None}
+def request_status(priority=PRIORITY_TELEMETRY, ids=None):
+    return io_worker.submit(priority, Hand.status_all, ids)
+
+# Status sweep for motion watches, empty if a stop cancelled it while queued
+def poll_motion(ids):
+    try:
+        return request_status(PRIORITY_MOTION, ids).result()
+    except CancelledError:
+        return {}
 
-# Extend actuator with mode-dependent step size
+# Extend actuator with mode-dependent step size, the jog buffer sends it on the next tick
 def extend_actuator(id):
     step = 10 if mode_var.get() else 100  # Micro mode: 10, Normal mode: 100
+    cut_streams()
     actuator_positions[id] = min(actuator_positions[id] + step, MAX_POS)
-    broadcast(ser, 5, *[actuator_positions[i] for i in range(1, 6)])
+    jog_buffer.update(actuator_positions[i] for i in range(1, 6))
 
-# Retract actuator with mode-dependent step size
+# Retract actuator with mode-dependent step size, the jog buffer sends it on the next tick
 def retract_actuator(id):
     step = 10 if mode_var.get() else 100  # Micro mode: 10, Normal mode: 100
+    cut_streams()
     actuator_positions[id] = max(actuator_positions[id] - step, MIN_POS)
-    broadcast(ser, 5, *[actuator_positions[i] for i in range(1, 6)])
+    jog_buffer.update(actuator_positions[i] for i in range(1, 6))
 
 # Extend all actuators to MAX_POS
 def extend_all():
     for id in range(1, 6):
         actuator_positions[id] = MAX_POS
     actuator_positions[5] = MAX_POS - 300  # Adjust actuator 5 to avoid collision
-    broadcast(ser, 5, MAX_POS, MAX_POS, MAX_POS, MAX_POS, MAX_POS-300)
+    move(MAX_POS, MAX_POS, MAX_POS, MAX_POS, MAX_POS-300)
 
 # Retract all actuators to MIN_POS
 def retract_all():
     for id in range(1, 6):
         actuator_positions[id] = MIN_POS
-    broadcast(ser, 5, MIN_POS, MIN_POS, MIN_POS, MIN_POS, MIN_POS)
+    move(MIN_POS, MIN_POS, MIN_POS, MIN_POS, MIN_POS)
 
 # Prompt user for gesture name
 def get_gesture_name(default_name):
@@ -162,6 +166,11 @@ def update_gesture_listbox():
     gesture_listbox.delete(0, tk.END)
     for gesture in gestures:
         gesture_listbox.insert(tk.END, gesture['name'])
+    update_transitions()
+
+# Compile the transitions between all stored gestures, so playing one starts without computing anything
+def update_transitions():
+    transitions.precompute(gesture['positions'] for gesture in gestures)
 
 # Play selected gesture
 def play_gesture():
@@ -171,20 +180,40 @@ def play_gesture():
         gesture = gestures[index]
         for id, pos in enumerate(gesture['positions'], start=1):
             actuator_positions[id] = pos
-        broadcast(ser, 5, *gesture['positions'])
-        threading.Timer(1.5, stop_after_gesture).start()
-
-# Stop all actuators after 1 second (for gestures only)
+        if trace.enabled:
+            trace.instant('play gesture', 'app', name=gesture['name'])
+        global gesture_stop
+        cut_streams()  # A gesture or dance still playing stops, this one starts from wherever it got to
+        gesture_stop = threading.Event()
+        threading.Thread(target=run_gesture, args=(gesture['positions'], gesture_stop), daemon=True).start()
+
+# Move from the measured pose to the gesture within the speed limits, then stop where the actuators
+# are as soon as every one has reached its target or stalled gripping something
+def run_gesture(positions, stop_event):
+    start = poll_motion(None)
+    start = [start[id].current_pos if start.get(id) else actuator_positions[id] for id in range(1, 6)]
+    stream = transitions.get(start, positions)
+    done = watch(poll_motion, dict(zip(range(1, 6), positions)), timeout=stream.duration + GESTURE_TIMEOUT, stop=stop_event)
+    play_stream(stream, stop_event)
+    result = done.result()
+    if trace.enabled:
+        trace.instant('gesture settled', 'app', outcomes=result.outcomes, seconds=result.elapsed)
+    if not stop_event.is_set():
+        stop_after_gesture()
+
+# Stop all actuators where they are once a gesture has been played
 def stop_after_gesture():
+    if trace.enabled:
+        trace.instant('stop after gesture', 'app')
+    statuses = request_status(PRIORITY_MOTION).result()
     current_positions = []
     for id in range(1, 6):
-        status = control(ser, id)
+        status = statuses.get(id)
         if status:
-            current_pos, _, _, _ = status
-            current_positions.append(current_pos)
+            current_positions.append(status.current_pos)
         else:
             current_positions.append(actuator_positions[id])
-    broadcast(ser, 5, *current_positions)
+    stop(*current_positions)
     for id, pos in enumerate(current_positions, start=1):
         actuator_positions[id] = pos
 
@@ -195,6 +224,7 @@ def edit_gesture():
         index = selected[0]
         positions = [actuator_positions[id] for id in range(1, 6)]
         gestures[index]['positions'] = positions
+        update_transitions()
         messagebox.showinfo("Info", f"{gestures[index]['name']} updated with current positions.")
 
 # Rename selected gesture
@@ -286,66 +316,179 @@ def load_gestures_from_file():
         messagebox.showerror("Error", f"Failed to load gestures: {str(e)}")
 
 # Update actuator status in GUI with error handling
+# Moving or loading actuators are polled fast, settled ones at a heartbeat (see AdaptivePoller)
 def update_status():
     while True:
-        for id in range(1, 6):
-            status = control(ser, id)
+        ids = status_poller.due()
+        if ids:
+            statuses = request_status(ids=ids).result()
+            status_poller.update(statuses)
+            telemetry.record(statuses)
+            show_status(statuses)
+        status_poller.wait()
+
+# Drive the status display from a recorded session instead of the hand
+def replay_status(replay):
+    def on_sweep(statuses, t):
+        telemetry.record(statuses, t)
+        show_status(statuses)
+    stats = replay.run(on_sweep=on_sweep)
+    print(f"Replay finished: {stats['frames']} frames, {stats['sweeps']} sweeps, {stats['frames_per_sec']:,.0f} frames/sec")
+
+# Hand a status sweep {id: Status or None} to the GUI thread, safe to call from any thread
+def show_status(statuses):
+    status_queue.put(statuses)
+
+# Set a label's text only when it changed, returns 1 if the label was updated
+def set_label(label, text):
+    if label_text.get(label) == text:
+        return 0
+    label_text[label] = text
+    label.config(text=text)
+    return 1
+
+# GUI tick: apply the newest status of every actuator queued since the last tick, then reschedule
+def refresh_status(root):
+    start = time.perf_counter()
+    latest = {}
+    while True:
+        try:
+            statuses = status_queue.get_nowait()
+        except queue.Empty:
+            break
+        for id, status in statuses.items():
             if status:
-                current_pos, temp, current, force = status
-                pos_labels[id].config(text=f"Position: {current_pos}")
-                temp_labels[id].config(text=f"Temp: {temp}°C")
-                current_labels[id].config(text=f"Current: {current}mA")
-                force_labels[id].config(text=f"Force: {force}")
+                latest[id] = status
             else:
                 print(f"Failed to get status for actuator {id}")
-        time.sleep(0.2)
-
-# Dance sequence function
-def dance():
-    # Step 1: Extend actuators 1 to 5 one by one
-    for id in range(1, 6):
-        actuator_positions[id] = MAX_POS  # Fully extend
-        broadcast(ser, 5, *[actuator_positions[i] for i in range(1, 6)])
-        time.sleep(0.2)  # Wait 0.2 second between each
-
-    # Step 2: Retract actuators 5 to 1 one by one
-    for id in range(5, 0, -1):
-        actuator_positions[id] = MIN_POS  # Fully retract
-        broadcast(ser, 5, *[actuator_positions[i] for i in range(1, 6)])
-        time.sleep(0.5)  
-    
-    for id in range(1, 6):
-        actuator_positions[id] = MAX_POS  # Fully extend
-        broadcast(ser, 5, *[actuator_positions[i] for i in range(1, 6)])
-        time.sleep(0.5)  
-    
-    # Step 2: Retract actuators 5 to 1 one by one
-    for id in range(5, 0, -1):
-        actuator_positions[id] = MIN_POS  # Fully retract
-        broadcast(ser, 5, *[actuator_positions[i] for i in range(1, 6)])
-        time.sleep(0.5)  
-    time.sleep(1)  # Wait 1 second between each
-
-    # Step 3: Wiggle fingers (actuators 1-4) for 10 seconds
-    start_time = time.time()
-    while time.time() - start_time < 10:  # Wiggle for 10 seconds
-        for i in range(1, 7):
-            broadcast(ser, 5, cycle(i), cycle(i-1), cycle(i-2), cycle(i-3), cycle(i-4))
-            time.sleep(0.2)
+    updates = 0
+    for id, (_, current_pos, temp, current, force) in latest.items():
+        updates += set_label(pos_labels[id], f"Position: {current_pos}")
+        updates += set_label(temp_labels[id], f"Temp: {temp}°C")
+        updates += set_label(current_labels[id], f"Current: {current}mA")
+        updates += set_label(force_labels[id], f"Force: {force}")
+    cost = time.perf_counter() - start
+    record_refresh('labels', cost, updates)
+    period = 1000 // GUI_FPS
+    root.after(max(period - int(cost * 1000), 1), refresh_status, root)
+
+# Strip charts of position, current and force: one canvas per field, one line per actuator
+def build_charts(parent):
+    for column, (field, title) in enumerate(CHART_FIELDS):
+        canvas = tk.Canvas(parent, width=CHART_WIDTH, height=CHART_HEIGHT, bg='white',
+                           highlightthickness=1, highlightbackground='#cccccc')
+        canvas.grid(row=0, column=column, padx=5, sticky='nsew')
+        canvas.create_text(4, 2, text=title, anchor='nw', fill='#333333', font=('Segoe UI', 8))
+        scale_text = canvas.create_text(CHART_WIDTH - 4, 2, text='', anchor='ne', fill='#888888', font=('Segoe UI', 8))
+        lines = {id: canvas.create_line(0, 0, 0, 0, fill=color, state='hidden')
+                 for id, color in zip(range(1, 6), CHART_COLORS)}
+        charts[field] = {'canvas': canvas, 'lines': lines, 'scale_text': scale_text, 'low': None, 'high': None}
+        parent.grid_columnconfigure(column, weight=1)
+    legend = ttk.Frame(parent)
+    legend.grid(row=1, column=0, columnspan=len(CHART_FIELDS), pady=(5, 0))
+    for id, color in zip(range(1, 6), CHART_COLORS):
+        tk.Label(legend, text=f"Actuator {id}", fg=color, font=('Segoe UI', 8)).pack(side=tk.LEFT, padx=5)
+
+# GUI tick: redraw the strip charts from the telemetry ring, then reschedule
+# Lines are reused (only their coordinates change) and skipped when nothing new arrived
+def refresh_charts(root):
+    start = time.perf_counter()
+    updates = 0
+    ids = [id for id in range(1, 6) if telemetry.size(id)]
+    if ids:
+        t1 = max(float(telemetry.latest(id, 1)['t'][0]) for id in ids)  # Charts end at the newest sample
+        t0 = t1 - CHART_WINDOW
+        for field, chart in charts.items():
+            stale = [id for id in ids if chart_drawn.get((field, id)) != (telemetry.count(id), t1)]
+            if not stale:
+                continue
+            data = {id: chart_line(id, field, t0, t1) for id in stale}
+            low, high = chart['low'], chart['high']
+            for _, values in data.values():
+                if len(values):
+                    low = values.min() if low is None else min(low, values.min())
+                    high = values.max() if high is None else max(high, values.max())
+            if (low, high) != (chart['low'], chart['high']):
+                # The range only grows, so the lines do not jump around; redraw them all on the new scale
+                chart['low'], chart['high'] = low, high
+                chart['canvas'].itemconfigure(chart['scale_text'], text=f"{low:g} .. {high:g}")
+                data = {id: chart_line(id, field, t0, t1) for id in ids}
+            scale = (CHART_HEIGHT - 20) / max(float(high) - float(low), 1.0)
+            for id, (columns, values) in data.items():
+                line = chart['lines'][id]
+                if len(columns):
+                    ys = (CHART_HEIGHT - 4) - (values - low) * scale
+                    chart['canvas'].coords(line, *np.column_stack((columns, ys)).ravel().tolist())
+                    chart['canvas'].itemconfigure(line, state='normal')
+                else:
+                    chart['canvas'].itemconfigure(line, state='hidden')
+                chart_drawn[(field, id)] = (telemetry.count(id), t1)
+                updates += 1
+    record_refresh('charts', time.perf_counter() - start, updates)
+    root.after(1000 // CHART_FPS, refresh_charts, root)
+
+# Decimated (columns, values) of one actuator's field between t0 and t1
+def chart_line(id, field, t0, t1):
+    samples = telemetry.window(id, CHART_WINDOW * 1000, now=t1)
+    return decimate_minmax(samples['t'], samples[field].astype('f8'), t0, t1, CHART_WIDTH)
+
+# Add one tick's cost to the refresh statistics
+def record_refresh(kind, cost, updates):
+    stats = refresh_stats[kind]
+    stats['ticks'] += 1
+    stats['updates'] += updates
+    stats['seconds'] += cost
+    stats['max'] = max(stats['max'], cost)
+
+# Summary of the GUI refresh cost, printed when the client exits
+def report_refresh():
+    for kind, stats in refresh_stats.items():
+        ticks = stats['ticks']
+        if ticks:
+            print(f"GUI {kind} refresh: {ticks} ticks, {stats['updates']} updates, "
+                  f"mean {1000 * stats['seconds'] / ticks:.3f} ms, max {1000 * stats['max']:.3f} ms per tick")
+
+# Dance routine as sequence steps (see flesh.sequence) from the pose the hand starts in
+def dance_steps(start):
+    pose = list(start)
+    steps = []
+
+    # Jump one actuator at a time, holding `hold` seconds after each
+    def one_by_one(ids, pos, hold):
+        for id in ids:
+            pose[id - 1] = pos
+            steps.extend([{'pose': list(pose)}, {'wait': hold}])
+
+    one_by_one(range(1, 6), MAX_POS, 0.2)    # Step 1: Extend actuators 1 to 5 one by one
+    one_by_one(range(5, 0, -1), MIN_POS, 0.5)  # Step 2: Retract actuators 5 to 1 one by one
+    one_by_one(range(1, 6), MAX_POS, 0.5)
+    one_by_one(range(5, 0, -1), MIN_POS, 0.5)
+    steps.append({'wait': 1})
+
+    # Step 3: Wiggle fingers (actuators 1-4) for about 10 seconds as one smooth wave
+    wave = [{'move': [cycle(i - k) for k in range(5)], 'duration': 0.2} for i in range(1, 7)]
+    steps.append({'repeat': 9, 'steps': wave})
 
     # Step 4: Final retraction of all actuators to MIN_POS
-    retract_all()
-    time.sleep(1)  # Wait for all actuators to retract
+    steps += [
+        {'pose': [MIN_POS] * 5}, {'wait': 1},
+        {'pose': [25, 25, 225, 1775, 1775]}, {'wait': 3},  # F yeah
+        {'pose': [1775, 25, 225, 25, 1775]}, {'wait': 3},  # Peace sign
+        {'pose': [MIN_POS] * 5},
+    ]
+    return steps
+
+# Dance compiled to ready-to-send frames, once per start pose
+@functools.lru_cache(maxsize=8)
+def dance_sequence(start):
+    return compile_sequence(dance_steps(start), rate=TRAJECTORY_RATE, start=start)
 
-    # F yeah
-    broadcast(ser, 5, 25,25,225,1775,1775)
-    time.sleep(3)  # Wait for all actuators to retract
-    
-    # Peace sign
-    broadcast(ser, 5, 1775,25,225,25,1775)
-    time.sleep(3)  # Wait for all actuators to retract
-
-    retract_all()
+# Dance sequence function
+def dance():
+    global dance_stop
+    cut_streams()
+    dance_stop = threading.Event()
+    play_stream(dance_sequence(tuple(actuator_positions[i] for i in range(1, 6))), dance_stop)
 
 # Start dance in a separate thread to keep GUI responsive
 def start_dance():
@@ -387,18 +530,41 @@ def load_gestures_at_startup():
 
 # Main GUI setup
 def main():
-    global ser, gesture_listbox, mode_var
+    global hand, io_worker, jog_buffer, gesture_listbox, mode_var
     port = 'COM10'  # Adjust to your serial port
     baudrate = 921600  # Adjust to your baud rate
-    
-    # Open serial port
-    ser = openSerial(port, baudrate)
-    if ser is None:
-        print("Failed to open serial port")
-        return
+
+    parser = argparse.ArgumentParser(description='Robotic hand client')
+    parser.add_argument('--replay', help='show a recorded session (flesh.recorder) instead of the live hand status')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 1 for real time, 0 for as fast as possible')
+    parser.add_argument('--seek', type=float, default=0, help='start the replay this many seconds into the recording')
+    args = parser.parse_args()
+    replay = None
+    
+    if args.replay:
+        # Controls drive an emulated hand so a replay never moves the real one
+        replay = Replay.open(args.replay, speed=args.speed)
+        replay.seek(args.seek)
+        hand = Hand(EmulatedPort())
+    else:
+        # Open serial port
+        try:
+            hand = Hand.open(port, baudrate)
+        except serial.SerialException as e:
+            print(f"Failed to open serial port: {e}")
+            return
+    io_worker = IOWorker(hand)
+    io_worker.start()
+    if METRICS_PORT:
+        try:
+            metrics.serve(METRICS_PORT)
+        except OSError as e:
+            print(f"Metrics endpoint not started: {e}")
+    jog_buffer = TargetBuffer(send_targets, JOG_PERIOD)
+    jog_buffer.start()
     
     # Initialize all actuators to position MIN_POS
-    broadcast(ser, 5, MIN_POS, MIN_POS, MIN_POS, MIN_POS, MIN_POS)
+    move(MIN_POS, MIN_POS, MIN_POS, MIN_POS, MIN_POS)
     time.sleep(1)
 
     # Setup GUI with modern light theme
@@ -573,6 +739,11 @@ def main():
     load_file_btn = ttk.Button(file_buttons_frame, text="Load from File", command=load_gestures_from_file, takefocus=0)
     load_file_btn.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=2)
     
+    # Live strip charts below the controls
+    chart_frame = ttk.LabelFrame(main_frame, text="Live Telemetry", padding="10")
+    chart_frame.pack(fill=tk.X, pady=(10, 0))
+    build_charts(chart_frame)
+    
     # Add a status bar at the bottom
     status_bar = ttk.Label(main_frame, text="Ready. Use keyboard shortcuts: 1-Retract All, 2-Extend All, 3-Dance", 
                            relief=tk.SUNKEN, anchor=tk.W, padding=(5, 2))
@@ -607,7 +778,10 @@ def main():
     update_gesture_listbox()
 
     # Start status update thread
-    status_thread = threading.Thread(target=update_status, daemon=True)
+    if replay is not None:
+        status_thread = threading.Thread(target=replay_status, args=(replay,), daemon=True)
+    else:
+        status_thread = threading.Thread(target=update_status, daemon=True)
     status_thread.start()
 
     # Set a minimum window size
@@ -620,8 +794,11 @@ def main():
     except:
         pass  # No icon file available
         
-    # Run GUI
+    # Run GUI, status labels are refreshed from the queue at up to GUI_FPS
+    refresh_status(root)
+    refresh_charts(root)
     root.mainloop()
+    report_refresh()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+## Micro-benchmark: frames/sec of the template encoders vs the original list-building functions
+## Run from the repository root: python benchmarks/bench_encoders.py
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.encoder import BroadcastEncoder, WriteEncoder, status_query
+
+N = 200000
+
+
+# Stand-in for a serial port: pyserial converts lists and bytearrays to bytes before writing
+class NullPort:
+    def write(self, data):
+        return len(bytes(data))
+
+
+# Original broadcast() frame building from FLESH_client.py
+def legacy_broadcast(ser, num, val1, val2, val3, val4, val5):
+    bytes = [0x55, 0xAA, 1 + num * 3, 0xff, 0xf2]
+    actuator_values = [val1, val2, val3, val4, val5]
+    for i, val in enumerate(actuator_values):
+        bytes.append(i + 1)
+        bytes.append(val & 0xFF)
+        bytes.append((val >> 8) & 0xFF)
+    checksum = sum(bytes[2:]) & 0xFF
+    bytes.append(checksum)
+    ser.write(bytes)
+
+
+# Original control() request building
+def legacy_control(ser, id):
+    command = [0x55, 0xAA, 0x03, id, 0x04, 0x00, 0x22]
+    checksum = sum(command[2:]) & 0xFF
+    command.append(checksum)
+    ser.write(bytes(command))
+
+
+# Original writeRegister() request building
+def legacy_write(ser, id, add, num, val):
+    bytes = [0x55, 0xAA, num + 2, id, 0x02, add]
+    for i in range(num):
+        bytes.append(val[i])
+    checksum = sum(bytes[2:]) & 0xFF
+    bytes.append(checksum)
+    ser.write(bytes)
+
+
+# Check the encoders produce the same bytes as the originals
+def check(ser):
+    captured = []
+    ser.write = captured.append
+    legacy_broadcast(ser, 5, 25, 500, 1000, 1500, 1775)
+    legacy_control(ser, 3)
+    legacy_write(ser, 2, 55, 6, [1, 2, 3, 4, 5, 6])
+    expected = [bytes(frame) for frame in captured]
+    got = [bytes(BroadcastEncoder(5).encode((25, 500, 1000, 1500, 1775))),
+           status_query(3),
+           bytes(WriteEncoder().encode(2, 55, [1, 2, 3, 4, 5, 6]))]
+    assert got == expected, (got, expected)
+    del ser.write
+
+
+# Frames per second for a callable that emits frames_per_call frames
+def rate(stmt, frames_per_call=1):
+    number = N // frames_per_call
+    best = min(timeit.repeat(stmt, number=number, repeat=3))
+    return number * frames_per_call / best
+
+
+def main():
+    ser = NullPort()
+    check(ser)
+    encoder = BroadcastEncoder(5)
+    writer = WriteEncoder()
+    poses = [(i % 1750 + 25, 500, 1000, 1500, (i * 7) % 1750 + 25) for i in range(64)]
+    val = [1, 2, 3, 4, 5, 6]
+
+    results = [
+        ('broadcast', rate(lambda: legacy_broadcast(ser, 5, *poses[7])),
+                      rate(lambda: ser.write(encoder.encode(poses[7])))),
+        ('broadcast (changing)', rate(lambda: [legacy_broadcast(ser, 5, *p) for p in poses], len(poses)),
+                                 rate(lambda: [ser.write(encoder.encode(p)) for p in poses], len(poses))),
+        ('control', rate(lambda: legacy_control(ser, 3)),
+                    rate(lambda: ser.write(status_query(3)))),
+        ('writeRegister', rate(lambda: legacy_write(ser, 2, 55, 6, val)),
+                          rate(lambda: ser.write(writer.encode(2, 55, val)))),
+    ]
+    print(f"{'frame':<22}{'legacy frames/s':>18}{'template frames/s':>20}{'speedup':>10}")
+    for name, legacy, template in results:
+        print(f"{name:<22}{legacy:>18,.0f}{template:>20,.0f}{template / legacy:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+## Protocol and round-trip benchmark suite
+## Measures encode/decode throughput of the broadcast, control, readRegister and
+## writeRegister frames, round-trip latency percentiles, the sustainable
+## status-poll and command rates against the emulated bus (or a real port),
+## recorded-session replay throughput and the import-to-first-command time of
+## the headless client.
+## Results are written as JSON and compared against benchmarks/baseline.json.
+##
+## python benchmarks/run_benchmarks.py                    # run and compare
+## python benchmarks/run_benchmarks.py --update-baseline  # store a new baseline
+## python benchmarks/run_benchmarks.py --port COM10       # round trips on a real or pty port
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.protocol import CMD_RD, is_status
+from flesh.encoder import BroadcastEncoder, WriteEncoder, status_query, read_request
+from flesh.decoder import FrameDecoder
+from flesh.emulator import EmulatedPort, HandEmulator
+from flesh.poller import poll_status
+from flesh.transport import transact_frame, send
+from flesh.recorder import Recorder, load
+from flesh.replay import Replay
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_TOLERANCE = 0.4     # Allowed relative slowdown before a metric counts as a regression, shared machines are noisy
+
+
+# Run fn repeatedly for about `duration` seconds, returns the best calls per second of `repeat` rounds
+def throughput(fn, duration=0.5, batch=1000, repeat=5):
+    best = 0.0
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        end = start + duration / repeat
+        while True:
+            for _ in range(batch):
+                fn()
+            calls += batch
+            now = time.perf_counter()
+            if now >= end:
+                break
+        best = max(best, calls / (now - start))
+    return best
+
+
+# Percentile of an already sorted list
+def percentile(sorted_values, q):
+    index = min(int(q / 100 * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def metric(value, unit, better):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def bench_encode():
+    broadcast = BroadcastEncoder(5)
+    writer = WriteEncoder()
+    poses = [(i % 1750 + 25, 500, 1000, 1500, (i * 7) % 1750 + 25) for i in range(64)]
+    cursor = [0]
+
+    def encode_broadcast():
+        cursor[0] = (cursor[0] + 1) & 63
+        broadcast.encode(poses[cursor[0]])
+
+    val = [1, 2, 3, 4, 5, 6]
+    return {
+        'encode.broadcast': metric(throughput(encode_broadcast), 'frames/s', 'higher'),
+        'encode.control': metric(throughput(lambda: status_query(3)), 'frames/s', 'higher'),
+        'encode.readRegister': metric(throughput(lambda: read_request(2, 26, 2)), 'frames/s', 'higher'),
+        'encode.writeRegister': metric(throughput(lambda: writer.encode(2, 55, val)), 'frames/s', 'higher'),
+    }
+
+
+def bench_decode():
+    emulator = HandEmulator()
+    status = emulator.actuators[1].status_reply()
+    read = emulator.feed(read_request(1, 26, 2))[0]
+    write = emulator.feed(bytes(WriteEncoder().encode(1, 55, [0, 0])))[0]
+    results = {}
+    for name, frame in (('status', status), ('readRegister', read), ('writeRegister', write)):
+        stream = frame * 100
+        decoder = FrameDecoder()
+        rate = throughput(lambda: decoder.feed(stream), batch=10) * 100
+        results[f'decode.{name}'] = metric(rate, 'frames/s', 'higher')
+    # Same status stream cut into 7-byte chunks, exercises partial frames
+    stream = status * 100
+    chunks = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+    decoder = FrameDecoder()
+
+    def feed_chunks():
+        for chunk in chunks:
+            decoder.feed(chunk)
+
+    results['decode.status_chunked'] = metric(throughput(feed_chunks, batch=10) * 100, 'frames/s', 'higher')
+    return results
+
+
+def bench_round_trip(ser, samples=2000):
+    latencies = []
+    for i in range(samples):
+        id = i % 5 + 1
+        start = time.perf_counter()
+        frame = transact_frame(ser, status_query(id), lambda f: f.id == id and is_status(f))
+        if frame is not None:
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    results = {'round_trip.lost': metric(samples - len(latencies), 'replies', 'lower')}
+    if latencies:
+        for q in (50, 90, 99):
+            results[f'round_trip.p{q}'] = metric(percentile(latencies, q) * 1e6, 'us', 'lower')
+        results['round_trip.max'] = metric(latencies[-1] * 1e6, 'us', None)  # Reported, too noisy to gate on
+    read_rate = throughput(lambda: transact_frame(ser, read_request(1, 26, 2), lambda f: f.id == 1 and f.cmd == CMD_RD),
+                           duration=1.0, batch=50)
+    results['round_trip.readRegister_rate'] = metric(read_rate, 'transactions/s', 'higher')
+    return results
+
+
+def bench_rates(ser):
+    sweeps = throughput(lambda: poll_status(ser), duration=1.0, batch=20)
+    encoder = BroadcastEncoder(5)
+    commands = throughput(lambda: send(ser, encoder.encode((25, 500, 1000, 1500, 1775))), duration=0.5)
+    return {
+        'rate.status_sweeps': metric(sweeps, 'sweeps/s', 'higher'),
+        'rate.status_polls': metric(sweeps * 5, 'polls/s', 'higher'),
+        'rate.broadcast_commands': metric(commands, 'commands/s', 'higher'),
+    }
+
+
+# As-fast-as-possible replay of a recorded session of broadcasts and status sweeps
+def bench_replay(sweeps=5000, repeat=3):
+    ser = EmulatedPort(latency=0, baudrate=0)
+    encoder = BroadcastEncoder(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        with Recorder(os.path.join(tmp, 'bench')) as recorder:
+            recorder.attach(ser)
+            for i in range(sweeps):
+                send(ser, encoder.encode((i % 1750 + 25,) * 5))
+                poll_status(ser)
+            path = recorder.path
+        records = load(path)
+        best = 0.0
+        for _ in range(repeat):
+            best = max(best, Replay(records, speed=None).run(on_sweep=lambda statuses, t: None)['frames_per_sec'])
+        del records  # Release the map before the directory goes
+    return {'replay.frames': metric(best, 'frames/s', 'higher')}
+
+
+# Import-to-first-command time of the headless client, measured in fresh interpreters
+# (the emulator setup between the two timed sections is excluded)
+STARTUP_PROBE = '''
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import flesh
+import_time = time.perf_counter() - start
+from flesh.emulator import EmulatedPort
+port = EmulatedPort()
+start = time.perf_counter()
+flesh.Hand(port).status(1)
+command_time = time.perf_counter() - start
+print(import_time * 1000, (import_time + command_time) * 1000)
+'''
+
+
+def bench_startup(runs=5):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', STARTUP_PROBE, root], capture_output=True, text=True, check=True)
+        samples.append([float(x) for x in out.stdout.split()])
+    return {
+        'startup.import': metric(min(s[0] for s in samples), 'ms', 'lower'),
+        'startup.first_command': metric(min(s[1] for s in samples), 'ms', 'lower'),
+    }
+
+
+# Compare metrics with the baseline, returns the list of regression messages
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        ratio = current['value'] / reference['value'] if reference['value'] else float(current['value'] > 0) + 1
+        if current['better'] == 'higher':
+            worse = ratio < 1 - tolerance
+        elif current['better'] == 'lower':
+            worse = ratio > 1 + tolerance and current['value'] - reference['value'] > 1
+        else:
+            worse = False
+        status = 'REGRESSION' if worse else 'ok'
+        print(f"{name:<34}{current['value']:>16,.1f} {current['unit']:<16}{ratio:>7.2f}x baseline  {status}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FLESH protocol benchmarks')
+    parser.add_argument('--port', help='serial port for round-trip benchmarks (default: in-memory emulator)')
+    parser.add_argument('--baudrate', type=int, default=921600)
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    if args.port:
+        import serial
+        ser = serial.Serial(args.port, args.baudrate, timeout=1)
+    else:
+        ser = EmulatedPort(baudrate=args.baudrate)
+
+    results = {}
+    results.update(bench_encode())
+    results.update(bench_decode())
+    results.update(bench_round_trip(ser))
+    results.update(bench_rates(ser))
+    results.update(bench_replay())
+    results.update(bench_startup())
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'port': args.port or 'emulated',
+        'metrics': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['metrics']
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+## Headless protocol helpers for the FLESH 6 dof robotic hand
+## Only the client API is imported here, heavier parts (worker threads,
+## asyncio, the emulator) are imported from their modules when needed.
+
+from flesh.client import Hand, connect, openSerial, regdict, POSITION_REGISTERS
+from flesh.protocol import Status
@@ -0,0 +1,135 @@
+## asyncio client for the hand
+## Reads are driven by the event loop watching the serial file descriptor, so
+## many hands and other I/O share one loop without executor threads.
+## Needs a selector event loop and a port with a real fileno() (POSIX ttys and ptys).
+
+import asyncio
+
+import serial
+
+from flesh.protocol import CMD_RD, CMD_WR, is_status, parse_status, register_values, write_acknowledged
+from flesh.encoder import BroadcastEncoder, WriteEncoder, status_query, read_request
+from flesh.poller import ACTUATOR_IDS, status_queries
+from flesh.metrics import METRICS
+from flesh.transport import DEFAULT_TIMEOUT, decoder_for, send
+
+
+class AsyncHand:
+    """Awaitable status, motion and register access for one hand.
+
+    Create it from inside a running event loop; replies are matched to
+    waiting requests by actuator ID and command, oldest request first.
+    """
+
+    def __init__(self, ser, num=5, timeout=DEFAULT_TIMEOUT):
+        self.ser = ser
+        self.timeout = timeout
+        self._loop = asyncio.get_running_loop()
+        self._decoder = decoder_for(ser)
+        self._waiters = []
+        self._broadcast = BroadcastEncoder(num)
+        self._write = WriteEncoder()
+        ser.timeout = 0  # Reads only happen when the loop says the fd is readable
+        self._loop.add_reader(ser.fileno(), self._on_readable)
+
+    def close(self):
+        self._loop.remove_reader(self.ser.fileno())
+        for _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+        self.ser.close()
+
+    def _on_readable(self):
+        chunk = self.ser.read(self.ser.in_waiting or 1)
+        METRICS.inc('flesh_bytes_in_total', (), len(chunk))
+        self._dispatch(self._decoder.feed(chunk))
+
+    # Hand decoded frames to their waiters, park the rest
+    def _dispatch(self, frames):
+        for frame in frames:
+            for i, (match, future) in enumerate(self._waiters):
+                if not future.done() and match(frame):
+                    del self._waiters[i]
+                    future.set_result(frame)
+                    break
+            else:
+                self._decoder.pending.append(frame)
+
+    # Register a waiter for a reply accepted by match
+    def _expect(self, match):
+        frame = self._decoder.take(match)
+        future = self._loop.create_future()
+        if frame is not None:
+            future.set_result(frame)
+        else:
+            self._waiters.append((match, future))
+        return future
+
+    # Wait for a reply, None on timeout
+    async def _reply(self, future):
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            if self._decoder.needed():
+                self._dispatch(self._decoder.skip())  # Resync past a frame that never completed
+            return None
+        finally:
+            self._waiters = [w for w in self._waiters if w[1] is not future]
+
+    # Status of one actuator, Status tuple or None
+    async def status(self, id):
+        self._decoder.discard(lambda f: f.id == id and is_status(f))  # Late replies to earlier queries
+        future = self._expect(lambda f: f.id == id and is_status(f))
+        send(self.ser, status_query(id))
+        frame = await self._reply(future)
+        return parse_status(frame) if frame is not None else None
+
+    # Pipelined status of several actuators, {id: Status or None}
+    async def status_all(self, ids=ACTUATOR_IDS):
+        ids = tuple(ids)
+        self._decoder.discard(lambda f: f.id in ids and is_status(f))
+        futures = [self._expect(lambda f, id=id: f.id == id and is_status(f)) for id in ids]
+        send(self.ser, status_queries(ids))
+        frames = await asyncio.gather(*(self._reply(future) for future in futures))
+        return {id: parse_status(frame) if frame is not None else None for id, frame in zip(ids, frames)}
+
+    # Broadcast target positions for actuators 1..num (no reply)
+    async def move(self, positions):
+        try:
+            send(self.ser, self._broadcast.encode(positions))
+        except serial.SerialTimeoutException:
+            print("Write timeout in move")
+
+    # Read num register bytes starting at add, [] on timeout
+    async def read_register(self, id, add, num):
+        future = self._expect(lambda f: f.id == id and f.cmd == CMD_RD)
+        send(self.ser, read_request(id, add, num))
+        frame = await self._reply(future)
+        return register_values(frame) if frame is not None else []
+
+    # Write register bytes starting at add, True once the actuator acknowledged success
+    async def write_register(self, id, add, val):
+        future = self._expect(lambda f: f.id == id and f.cmd == CMD_WR)
+        send(self.ser, self._write.encode(id, add, val))
+        frame = await self._reply(future)
+        return frame is not None and write_acknowledged(frame, add)
+
+    # Async stream of full-hand status sweeps every `period` seconds
+    async def telemetry(self, period=0.01, ids=ACTUATOR_IDS):
+        next_time = self._loop.time()
+        while True:
+            yield await self.status_all(ids)
+            next_time += period
+            await asyncio.sleep(max(next_time - self._loop.time(), 0))
+
+
+# Open a serial port and wrap it in an AsyncHand
+async def open_hand(port, baudrate=921600, **kwargs):
+    ser = serial.Serial(port, baudrate, timeout=0, write_timeout=1)
+    return AsyncHand(ser, **kwargs)
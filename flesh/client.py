@@ -0,0 +1,152 @@
+## Headless client for the FLESH hand
+## The protocol code that used to be copy-pasted across the scripts. Nothing
+## here imports tkinter, so services and scripts start in milliseconds.
+
+import serial
+
+from flesh.protocol import CMD_RD, CMD_WR, is_status, parse_status, register_values, write_acknowledged
+from flesh.encoder import BroadcastEncoder, WriteEncoder, status_query, read_request
+from flesh.poller import poll_status
+from flesh.metrics import METRICS
+from flesh.transport import DEFAULT_TIMEOUT, decoder_for, transact_frame, send
+
+DEFAULT_BAUDRATE = 921600
+
+# Register address description, corresponding to the humanoid five-finger dexterous hand - RH56 user manual page 11, section 2.4 register description
+regdict = {
+    'ID'              : 2,    # ID
+    'baudrate'        : 12,   # Baud rate setting
+    'curLocat'        : 26,   # Current position
+    'zeroCalibra'     : 31,   # Force sensor zero calibration setting
+    'overCurproSet'   : 32,   # Overcurrent protection setting
+    'tarLocatSet'     : 55,   # Target position setting
+    'fSensorDada'     : 76,   # Force sensor data
+    'fOriginalValue'  : 78,   # Force sensor raw value
+    'forceAct'        : 98,   # Over-temperature protection setting
+    'warmUpSta'       : 100,  # Warm-up activation setting
+}
+
+# Registers writePosition() accepts, each holds three copies of a 16-bit value
+POSITION_REGISTERS = ('zeroCalibra', 'overCurproSet', 'tarLocatSet', 'forceAct', 'warmUpSta')
+
+
+# Set the serial port number and baud rate, then open the serial port
+def openSerial(port, baudrate=DEFAULT_BAUDRATE):
+    ser = serial.Serial()
+    ser.port = port
+    ser.baudrate = baudrate
+    ser.timeout = 1         # Read timeout, transactions set their own deadline
+    ser.write_timeout = 1   # Write timeout
+    ser.open()
+    return ser
+
+
+# Address and 6-byte payload (three copies of the 16-bit value) for a POSITION_REGISTERS write
+def position_payload(name, val):
+    if name not in POSITION_REGISTERS:
+        raise ValueError(f"{name!r} is not one of {', '.join(POSITION_REGISTERS)}")
+    lo, hi = val & 0xFF, (val >> 8) & 0xFF
+    return regdict[name], [lo, hi, lo, hi, lo, hi]
+
+
+class Hand:
+    """Connection handle for one hand.
+
+    Owns the port together with its frame templates, so repeated commands
+    reuse the same buffers. Not thread-safe: share it through one thread
+    (see flesh.worker.IOWorker) or guard it with a lock.
+    """
+
+    def __init__(self, ser, num=5, timeout=DEFAULT_TIMEOUT):
+        self.ser = ser
+        self.num = num
+        self.timeout = timeout
+        self.ids = tuple(range(1, num + 1))
+        self._broadcast = BroadcastEncoder(num)
+        self._write = WriteEncoder()
+
+    @classmethod
+    def open(cls, port, baudrate=DEFAULT_BAUDRATE, **kwargs):
+        return cls(openSerial(port, baudrate), **kwargs)
+
+    def close(self):
+        self.ser.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Write register bytes starting at add, True once the actuator acknowledged success
+    def write_register(self, id, add, val):
+        try:
+            frame = transact_frame(self.ser, self._write.encode(id, add, val),
+                                   lambda f: f.id == id and f.cmd == CMD_WR, self.timeout)
+            return frame is not None and write_acknowledged(frame, add)
+        except serial.SerialTimeoutException:
+            print(f"Write timeout in write_register for actuator {id}")
+            METRICS.inc('flesh_write_timeouts_total', (('cmd', 'write'),))
+            return False
+
+    # Read num register bytes starting at add, [] when no reply arrived
+    def read_register(self, id, add, num):
+        try:
+            frame = transact_frame(self.ser, read_request(id, add, num),
+                                   lambda f: f.id == id and f.cmd == CMD_RD, self.timeout)
+        except serial.SerialTimeoutException:
+            print(f"Write timeout in read_register for actuator {id}")
+            METRICS.inc('flesh_write_timeouts_total', (('cmd', 'read'),))
+            return []
+        return register_values(frame) if frame is not None else []
+
+    # Write a 16-bit value to one of POSITION_REGISTERS (three copies, 6 bytes)
+    def write_position(self, id, name, val):
+        return self.write_register(id, *position_payload(name, val))
+
+    # Status of one actuator, Status tuple or None
+    def status(self, id):
+        decoder_for(self.ser).discard(lambda f: f.id == id and is_status(f))  # Late replies to earlier queries
+        try:
+            frame = transact_frame(self.ser, status_query(id), lambda f: f.id == id and is_status(f), self.timeout)
+        except serial.SerialTimeoutException:
+            print(f"Write timeout in status for actuator {id}")
+            METRICS.inc('flesh_write_timeouts_total', (('cmd', 'control'),))
+            return None
+        return parse_status(frame) if frame is not None else None
+
+    # Pipelined status of several actuators, {id: Status or None}
+    def status_all(self, ids=None):
+        try:
+            return poll_status(self.ser, ids or self.ids, timeout=self.timeout)
+        except serial.SerialTimeoutException:
+            print("Write timeout in status_all")
+            METRICS.inc('flesh_write_timeouts_total', (('cmd', 'control'),))
+            return dict.fromkeys(ids or self.ids)
+
+    # Broadcast target positions for actuators 1..num
+    def broadcast(self, *positions):
+        try:
+            send(self.ser, self._broadcast.encode(positions))
+        except serial.SerialTimeoutException:
+            print("Write timeout in broadcast")
+            METRICS.inc('flesh_write_timeouts_total', (('cmd', 'broadcast'),))
+
+    # Write a prebuilt request frame that expects no reply, e.g. from a flesh.trajectory.FrameStream
+    def send_frame(self, frame):
+        try:
+            send(self.ser, frame)
+        except serial.SerialTimeoutException:
+            print("Write timeout in send_frame")
+            METRICS.inc('flesh_write_timeouts_total', (('cmd', 'broadcast'),))
+
+
+_hands = {}
+
+
+# Reusable handle for a port: the first call opens it, later calls return the same Hand
+def connect(port, baudrate=DEFAULT_BAUDRATE, **kwargs):
+    hand = _hands.get(port)
+    if hand is None or not hand.ser.is_open:
+        hand = _hands[port] = Hand.open(port, baudrate, **kwargs)
+    return hand
@@ -0,0 +1,117 @@
+## Incremental, resynchronising decoder for 0xAA 0x55 reply frames
+## Accepts arbitrary byte chunks (partial frames, several frames per read,
+## line noise in between) and yields only frames whose checksum verifies.
+
+from collections import deque
+
+from flesh import trace
+from flesh.protocol import RX_HEADER, FRAME_OVERHEAD, MAX_LEN, Frame
+
+MIN_LEN = 1                 # A reply carries at least the command byte
+PENDING_LIMIT = 64          # Decoded frames kept for later consumers
+
+
+class FrameDecoder:
+    """Streaming frame decoder.
+
+    feed() returns the frames completed by a chunk. Frames nobody has claimed
+    yet can also be parked in `pending` and picked up later with take(), so a
+    reply that arrives in the same read as another is never lost.
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.pending = deque(maxlen=PENDING_LIMIT)
+        self.frames = 0             # Good frames decoded
+        self.checksum_errors = 0    # Headers whose frame failed the checksum
+        self.dropped_bytes = 0      # Bytes discarded while resyncing
+        self.taps = []              # Callables fed every good frame, e.g. a recorder
+
+    # Add a chunk of received bytes and return the list of complete, checked frames
+    def feed(self, chunk):
+        buf = self.buf
+        buf += chunk
+        frames = []
+        pos = 0
+        end = len(buf)
+        while True:
+            start = buf.find(RX_HEADER, pos)
+            if start < 0:
+                # Keep a trailing 0xAA, it may be the first half of the next header
+                keep = end - 1 if end > pos and buf[end - 1] == RX_HEADER[0] else end
+                self.dropped_bytes += keep - pos
+                pos = keep
+                break
+            self.dropped_bytes += start - pos
+            pos = start
+            if end - pos < 3:
+                break  # Length byte not here yet
+            length = buf[pos + 2]
+            if length < MIN_LEN or length > MAX_LEN:
+                # No reply is this short or long, a header in line noise: skip it instead of waiting for its bytes
+                pos += 1
+                self.dropped_bytes += 1
+                continue
+            total = length + FRAME_OVERHEAD
+            if end - pos < total:
+                break  # Wait for the rest of the frame
+            last = pos + total - 1
+            if sum(buf[pos + 2:last]) & 0xFF != buf[last]:
+                # Bad frame, skip only this header so a real frame inside it is still found
+                self.checksum_errors += 1
+                self.dropped_bytes += 1
+                if trace.enabled:
+                    trace.instant('checksum error', 'bus')
+                pos += 1
+                continue
+            raw = bytes(buf[pos:last + 1])
+            frames.append(Frame(raw[3], raw[4], raw[5:-1], raw))
+            pos = last + 1
+        del buf[:pos]
+        self.frames += len(frames)
+        if trace.enabled:
+            for frame in frames:
+                trace.instant('reply', 'bus', id=frame.id, cmd=frame.cmd, bytes=len(frame.raw))
+        if self.taps:
+            for tap in self.taps:
+                for frame in frames:
+                    tap(frame)
+        return frames
+
+    # Bytes still needed to finish the frame at the head of the buffer (0 when unknown)
+    def needed(self):
+        buf = self.buf
+        if len(buf) < 3 or buf[:2] != RX_HEADER:
+            return 0
+        return max(buf[2] + FRAME_OVERHEAD - len(buf), 1)
+
+    # Give up on the partial frame at the head of the buffer, e.g. when a deadline passed before
+    # the rest of it arrived, and resync to the next header in what is buffered
+    # Returns the frames that completes, the caller parks or uses them like those of feed()
+    def skip(self):
+        if self.needed() == 0:
+            return []
+        del self.buf[:1]
+        self.dropped_bytes += 1
+        return self.feed(b'')
+
+    # Remove and return the first pending frame accepted by match, or None
+    def take(self, match):
+        for frame in self.pending:
+            if match(frame):
+                self.pending.remove(frame)
+                return frame
+        return None
+
+    # Remove every pending frame accepted by match, e.g. late replies to requests that timed out
+    # before asking again. Returns how many were dropped
+    def discard(self, match):
+        stale = [frame for frame in self.pending if match(frame)]
+        for frame in stale:
+            self.pending.remove(frame)
+        return len(stale)
+
+    # Forget buffered bytes and pending frames
+    def reset(self):
+        self.buf.clear()
+        self.pending.clear()
@@ -0,0 +1,360 @@
+## Software emulator of the actuator bus
+## Speaks the same protocol as the hand over an in-memory port object or a pty:
+## broadcast positioning (0xFF 0xF2), register read (0x01) / write (0x02) and
+## the status query (0x04 0x22) with its 22-byte reply. Each actuator follows a
+## first-order motion model with current, temperature and contact force.
+##
+## Run `python -m flesh.emulator --link COM10` from the script directory and
+## FLESH_client.py / query.py open the emulated hand instead of the real one.
+
+import argparse
+import math
+import os
+import random
+import signal
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+from flesh.protocol import (TX_HEADER, RX_HEADER, CMD_RD, CMD_WR, CMD_MC, QUERY_STATUS,
+                            BROADCAST_ID, CMD_BROADCAST_POS, request_length)
+
+REG_ID = 2
+REG_BAUDRATE = 12
+REG_CUR_LOCAT = 26
+REG_OVER_CUR = 32
+REG_TAR_LOCAT = 55
+REG_FORCE = 76
+REG_FORCE_RAW = 78
+REG_FORCE_ACT = 98
+REG_WARM_UP = 100
+REGISTER_SIZE = 256
+
+STATUS_BODY = struct.Struct('<BBBHhbHhBB')  # cmd, 0x00, 0x22, target, pos, temp, current, force, error, state
+
+
+class Actuator:
+    """First-order model of one linear actuator."""
+
+    def __init__(self, id, tau=0.15, contact=None, stiffness=2.0):
+        self.id = id
+        self.tau = tau                      # Motion time constant in seconds
+        self.contact = contact              # Position where the finger meets an object, None for free motion
+        self.stiffness = stiffness          # Force units per position unit past contact
+        self.pos = 0.0
+        self.target = 0
+        self.velocity = 0.0
+        self.temp = 25.0
+        self.current = 0
+        self.force = 0
+        self.error = 0
+        self.registers = bytearray(REGISTER_SIZE)
+        self.registers[REG_ID] = id
+
+    # Advance the model by dt seconds
+    def step(self, dt):
+        if dt <= 0:
+            return
+        goal = self.target
+        if self.contact is not None and goal > self.contact:
+            goal = self.contact + (goal - self.contact) * 0.05  # Pushing against the object barely moves
+        self.pos += (goal - self.pos) * (1 - math.exp(-dt / self.tau))
+        self.velocity = (goal - self.pos) / self.tau  # Instantaneous, not averaged over the step
+        if self.contact is not None and self.pos > self.contact:
+            self.force = int((self.pos - self.contact) * self.stiffness)
+        else:
+            self.force = 0
+        self.current = int(30 + abs(self.velocity) * 0.2 + self.force * 0.5)
+        # Heats with current, cools toward ambient
+        self.temp += dt * (self.current * 0.002 - (self.temp - 25.0) * 0.01)
+
+    def status_reply(self):
+        body = STATUS_BODY.pack(CMD_MC, 0x00, QUERY_STATUS, self.target & 0xFFFF, int(round(self.pos)),
+                                int(self.temp), self.current & 0xFFFF, self.force, self.error, 0) + bytes(3)
+        return _reply(self.id, body)
+
+    # Register file with the live values refreshed
+    def read(self, add, num):
+        regs = self.registers
+        struct.pack_into('<H', regs, REG_CUR_LOCAT, int(round(self.pos)) & 0xFFFF)
+        struct.pack_into('<H', regs, REG_TAR_LOCAT, self.target & 0xFFFF)
+        struct.pack_into('<h', regs, REG_FORCE, self.force)
+        struct.pack_into('<h', regs, REG_FORCE_RAW, self.force)
+        return bytes(regs[add:add + num])
+
+    def write(self, add, data):
+        self.registers[add:add + len(data)] = data
+        if add <= REG_TAR_LOCAT < add + len(data) - 1:
+            self.target = struct.unpack_from('<H', self.registers, REG_TAR_LOCAT)[0]
+
+
+# Reply frame from id and body (cmd onward, without checksum)
+def _reply(id, body):
+    frame = bytearray(RX_HEADER)
+    frame.append(len(body))
+    frame.append(id)
+    frame += body
+    frame.append(sum(frame[2:]) & 0xFF)
+    return bytes(frame)
+
+
+class HandEmulator:
+    """Protocol engine for a bus of actuators.
+
+    feed() takes request bytes and returns the replies to send back.
+    latency is the device turnaround time, drop_rate/corrupt_rate/noise_rate
+    are per-reply probabilities of no reply, a flipped byte or garbage bytes
+    in front of the reply.
+    """
+
+    def __init__(self, ids=(1, 2, 3, 4, 5), latency=0.0002, baudrate=921600,
+                 drop_rate=0.0, corrupt_rate=0.0, noise_rate=0.0, seed=None, clock=time.monotonic):
+        self.actuators = {id: Actuator(id) for id in ids}
+        self.latency = latency
+        self.baudrate = baudrate
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.noise_rate = noise_rate
+        self.random = random.Random(seed)
+        self.clock = clock
+        self._last = clock()
+        self._buf = bytearray()
+        self.requests = 0
+        self.replies = 0
+
+    # Advance every actuator model to the current clock
+    def advance(self):
+        now = self.clock()
+        dt = now - self._last
+        self._last = now
+        for actuator in self.actuators.values():
+            actuator.step(dt)
+
+    # Seconds to put n bytes on the wire
+    def wire_time(self, n):
+        return n * 10 / self.baudrate if self.baudrate else 0.0
+
+    # Parse request bytes, returns the list of reply byte strings
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        replies = []
+        while True:
+            start = buf.find(TX_HEADER)
+            if start < 0:
+                del buf[:-1 if buf[-1:] == TX_HEADER[:1] else len(buf)]
+                break
+            del buf[:start]
+            if len(buf) < 5:
+                break
+            size = request_length(buf)
+            if len(buf) < size:
+                break
+            frame = bytes(buf[:size])
+            if sum(frame[2:-1]) & 0xFF != frame[-1]:
+                del buf[:1]
+                continue
+            del buf[:size]
+            self.requests += 1
+            reply = self.handle(frame)
+            if reply is not None:
+                reply = self._inject(reply)
+                if reply is not None:
+                    replies.append(reply)
+                    self.replies += 1
+        return replies
+
+    # Apply one checked request frame
+    def handle(self, frame):
+        self.advance()
+        id, cmd = frame[3], frame[4]
+        if id == BROADCAST_ID and cmd == CMD_BROADCAST_POS:
+            for i in range(5, len(frame) - 1, 3):
+                actuator = self.actuators.get(frame[i])
+                if actuator is not None:
+                    actuator.target = frame[i + 1] | (frame[i + 2] << 8)
+            return None
+        actuator = self.actuators.get(id)
+        if actuator is None:
+            return None
+        if cmd == CMD_MC and frame[6] == QUERY_STATUS:
+            return actuator.status_reply()
+        if cmd == CMD_RD:
+            add, num = frame[5], frame[6]
+            return _reply(id, bytes([CMD_RD, add]) + actuator.read(add, num))
+        if cmd == CMD_WR:
+            add = frame[5]
+            actuator.write(add, frame[6:-1])
+            return _reply(id, bytes([CMD_WR, add, 0x01]))
+        return None
+
+    def _inject(self, reply):
+        rnd = self.random.random
+        if self.drop_rate and rnd() < self.drop_rate:
+            return None
+        if self.corrupt_rate and rnd() < self.corrupt_rate:
+            reply = bytearray(reply)
+            reply[self.random.randrange(2, len(reply))] ^= 0x5A
+            reply = bytes(reply)
+        if self.noise_rate and rnd() < self.noise_rate:
+            reply = bytes(self.random.randrange(256) for _ in range(self.random.randint(1, 8))) + reply
+        return reply
+
+
+class EmulatedPort:
+    """In-memory stand-in for serial.Serial connected to a HandEmulator.
+
+    Replies become readable after the emulator latency plus their wire time.
+    """
+
+    def __init__(self, emulator=None, timeout=1, **kwargs):
+        self.emulator = emulator or HandEmulator(**kwargs)
+        self.timeout = timeout
+        self.write_timeout = None
+        self.is_open = True
+        self.port = 'emulated'
+        self.baudrate = self.emulator.baudrate
+        self._rx = deque()              # (ready_time, bytes) in arrival order
+        self._ready = bytearray()
+        self._cond = threading.Condition()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.bytes_out += len(data)
+        emulator = self.emulator
+        arrived = emulator.clock() + emulator.wire_time(len(data))
+        replies = emulator.feed(data)
+        with self._cond:
+            for reply in replies:
+                # Replies share the line, each starts after the turnaround and after the previous one
+                start = max(arrived + emulator.latency, self._rx[-1][0] if self._rx else 0)
+                self._rx.append((start + emulator.wire_time(len(reply)), reply))
+            self._cond.notify_all()
+        return len(data)
+
+    # Move replies whose ready time has passed into the readable buffer (caller holds _cond)
+    def _collect(self):
+        now = self.emulator.clock()
+        while self._rx and self._rx[0][0] <= now:
+            self._ready += self._rx.popleft()[1]
+        return self._rx[0][0] - now if self._rx else None
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            self._collect()
+            return len(self._ready)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                next_ready = self._collect()
+                if len(self._ready) >= size:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                wait = remaining if next_ready is None else (next_ready if remaining is None else min(remaining, next_ready))
+                self._cond.wait(wait)
+            data = bytes(self._ready[:size])
+            del self._ready[:size]
+        self.bytes_in += len(data)
+        return data
+
+    # Make bytes readable right away as if they had come down the line, e.g. noise or a torn frame
+    def inject(self, data):
+        with self._cond:
+            self._collect()
+            self._ready += data
+            self._cond.notify_all()
+
+    def read_all(self):
+        return self.read(self.in_waiting)
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._collect()
+            self._ready.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class PtyServer:
+    """Serves a HandEmulator on the master side of a pty.
+
+    Open `path` (or the optional symlink) with pyserial like a real port.
+    """
+
+    def __init__(self, emulator=None, link=None, **kwargs):
+        import pty
+        import tty
+        self.emulator = emulator or HandEmulator(**kwargs)
+        self.master, self._slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self._slave)
+        self.path = os.ttyname(self._slave)
+        self.link = link
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(self.path, link)
+        self._thread = threading.Thread(target=self._run, name='flesh-emulator', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        emulator = self.emulator
+        while True:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            for reply in emulator.feed(data):
+                delay = emulator.latency + emulator.wire_time(len(reply))
+                if delay > 0:
+                    time.sleep(delay)
+                os.write(self.master, reply)
+
+    def close(self):
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulate the FLESH actuator bus on a pty')
+    parser.add_argument('--link', help='create a symlink to the pty, e.g. COM10 for the unmodified scripts')
+    parser.add_argument('--latency', type=float, default=0.0002, help='reply turnaround in seconds')
+    parser.add_argument('--drop', type=float, default=0.0, help='probability a reply is dropped')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='probability a reply byte is corrupted')
+    parser.add_argument('--noise', type=float, default=0.0, help='probability of garbage before a reply')
+    parser.add_argument('--seed', type=int, help='random seed for error injection')
+    args = parser.parse_args()
+
+    server = PtyServer(link=args.link, latency=args.latency, drop_rate=args.drop,
+                       corrupt_rate=args.corrupt, noise_rate=args.noise, seed=args.seed).start()
+    print(f"Emulated hand on {server.path}" + (f" (linked as {args.link})" if args.link else ""), flush=True)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # Remove the link when killed too
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
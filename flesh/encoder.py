@@ -0,0 +1,95 @@
+## Allocation-free request frame encoders
+## Each encoder owns a preallocated frame template and only patches the bytes
+## that change, keeping the checksum up to date incrementally. The returned
+## buffer is reused by the next call, so write it out before encoding again.
+
+import struct
+from functools import lru_cache
+
+from flesh.protocol import TX_HEADER, MAX_READ, CMD_RD, CMD_WR, CMD_MC, QUERY_STATUS, BROADCAST_ID, CMD_BROADCAST_POS
+
+U16 = struct.Struct('<H')
+BROADCAST_DATA = 5          # Offset of the first (id, lo, hi) triple in a broadcast frame
+WRITE_DATA = 6              # Offset of the first data byte in a write register frame
+
+
+# Build a complete request frame from its body (len byte onward) as immutable bytes
+def _frame(body):
+    body = bytes(body)
+    return TX_HEADER + body + bytes([sum(body) & 0xFF])
+
+
+# Status query frame for one actuator, built once per id
+@lru_cache(maxsize=None)
+def status_query(id):
+    return _frame([0x03, id, CMD_MC, 0x00, QUERY_STATUS])
+
+
+# Read register request frame, built once per (id, address, count)
+@lru_cache(maxsize=None)
+def read_request(id, add, num):
+    if not 0 < num <= MAX_READ:
+        raise ValueError(f'a read fetches 1 to {MAX_READ} registers, not {num}')
+    return _frame([num + 2, id, CMD_RD, add, num])
+
+
+class BroadcastEncoder:
+    """Broadcast positioning frame (0xFF 0xF2) for actuators 1..num."""
+
+    def __init__(self, num=5):
+        self.num = num
+        self.frame = bytearray(TX_HEADER + bytes([1 + num * 3, BROADCAST_ID, CMD_BROADCAST_POS]) + bytes(num * 3 + 1))
+        self._body = memoryview(self.frame)[2:-1]  # Checksummed bytes, a fixed view so summing allocates nothing
+        self._layout = struct.Struct('<' + 'BH' * num)  # (id, target) pairs, ids are constant
+        self._args = [0] * (num * 2)
+        self._args[0::2] = range(1, num + 1)
+        self.encode([0] * num)
+
+    # Patch the target of one actuator (index 0..num-1), adjusting the checksum by the byte delta
+    def set(self, index, val):
+        val &= 0xFFFF
+        old = self._args[index * 2 + 1]
+        if val != old:
+            self._args[index * 2 + 1] = val
+            U16.pack_into(self.frame, BROADCAST_DATA + 1 + index * 3, val)
+            delta = (val & 0xFF) + (val >> 8) - (old & 0xFF) - (old >> 8)
+            self.frame[-1] = (self.frame[-1] + delta) & 0xFF
+        return self.frame
+
+    # Patch all num targets with a single pack_into and return the frame buffer
+    def encode(self, positions):
+        args = self._args
+        args[1::2] = positions
+        try:
+            self._layout.pack_into(self.frame, BROADCAST_DATA, *args)
+        except struct.error:
+            # Out of range targets are truncated to 16 bits like the original broadcast()
+            args[1::2] = [val & 0xFFFF for val in positions]
+            self._layout.pack_into(self.frame, BROADCAST_DATA, *args)
+        self.frame[-1] = sum(self._body) & 0xFF
+        return self.frame
+
+    # Current targets in the frame
+    @property
+    def values(self):
+        return self._args[1::2]
+
+
+class WriteEncoder:
+    """Write register frames, one template per (id, address, count)."""
+
+    def __init__(self):
+        self._templates = {}
+
+    # Patch the data bytes of the (id, add, len(val)) template and return the frame buffer
+    def encode(self, id, add, val):
+        num = len(val)
+        key = (id, add, num)
+        entry = self._templates.get(key)
+        if entry is None:
+            frame = bytearray(TX_HEADER + bytes([num + 2, id, CMD_WR, add]) + bytes(num + 1))
+            entry = self._templates[key] = (frame, sum(frame[2:WRITE_DATA]))
+        frame, head_sum = entry
+        frame[WRITE_DATA:WRITE_DATA + num] = val
+        frame[-1] = (head_sum + sum(val)) & 0xFF
+        return frame
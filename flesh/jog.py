@@ -0,0 +1,89 @@
+## Coalescing target buffer for jogging
+## Jog events only record the latest target set. A fixed-rate sender sends it
+## at most once per control tick and skips the tick when nothing changed, so
+## key repeats never build a backlog and the hand stops within one tick of
+## the last event.
+
+import threading
+import time
+
+DEFAULT_PERIOD = 0.02       # Control tick in seconds (50 Hz)
+
+
+class TargetBuffer:
+    """Latest-value target buffer drained by a fixed-rate sender thread.
+
+    send(positions) is called with a tuple of targets and may return a Future;
+    while that Future is still pending the next send is held back, and the
+    newest targets go out on the following tick instead.
+    """
+
+    def __init__(self, send, period=DEFAULT_PERIOD):
+        self._send = send
+        self.period = period
+        self._lock = threading.Lock()
+        self._targets = None
+        self._sent = None           # Targets of the last send, or of the last sync()
+        self._version = 0
+        self._sent_version = 0
+        self._in_flight = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='flesh-jog', daemon=True)
+        self.updates = 0            # Target updates received
+        self.sends = 0              # Frames actually sent
+
+    # Record a new target set, replacing any set not sent yet
+    # Targets equal to the newest ones, e.g. a key held at the end of travel, change nothing
+    def update(self, positions):
+        targets = tuple(positions)
+        with self._lock:
+            self.updates += 1
+            if targets == self._targets:
+                return
+            self._targets = targets
+            self._version += 1
+
+    # Record targets that were sent by another path, so stale jog targets are not sent over them
+    def sync(self, positions):
+        with self._lock:
+            self._targets = self._sent = tuple(positions)
+            self._version += 1
+            self._sent_version = self._version
+
+    # Updates merged into a later send instead of producing their own frame
+    @property
+    def coalesced(self):
+        return self.updates - self.sends
+
+    # Send the newest targets if they changed and the previous send has completed
+    def flush(self):
+        with self._lock:
+            if self._version == self._sent_version:
+                return False
+            if self._in_flight is not None and not self._in_flight.done():
+                return False
+            targets = self._targets
+            self._sent_version = self._version
+            if targets == self._sent:
+                return False  # Changed and changed back before the tick, the hand already has these
+            self._sent = targets
+        self._in_flight = self._send(targets)
+        self.sends += 1
+        return True
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        next_tick = time.monotonic() + self.period
+        while not self._stop.wait(max(next_tick - time.monotonic(), 0)):
+            self.flush()
+            next_tick += self.period
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now + self.period  # Fell behind, do not burst to catch up
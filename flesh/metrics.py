@@ -0,0 +1,200 @@
+## Serial I/O health and latency metrics
+## Counters and latency histograms per command type and per actuator, kept in
+## process and cheap enough to stay on: an update is a lock, a dict lookup and
+## an add. Read them with METRICS.snapshot() or scrape them in Prometheus text
+## format from serve(), e.g. http://127.0.0.1:9464/metrics.
+
+import threading
+from bisect import bisect_left
+
+from flesh.protocol import CMD_RD, CMD_WR, CMD_MC, CMD_BROADCAST_POS
+
+DEFAULT_PORT = 9464
+RTT_BUCKETS = (0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5)  # Seconds
+COMMAND_NAMES = {CMD_RD: 'read', CMD_WR: 'write', CMD_MC: 'control', CMD_BROADCAST_POS: 'broadcast'}
+
+DESCRIPTIONS = {
+    'flesh_rtt_seconds': ('histogram', 'Request to reply time'),
+    'flesh_timeouts_total': ('counter', 'Requests whose reply did not arrive before the deadline'),
+    'flesh_write_timeouts_total': ('counter', 'Serial writes that timed out'),
+    'flesh_short_reads_total': ('counter', 'Deadlines that passed with part of a frame received'),
+    'flesh_bytes_out_total': ('counter', 'Bytes written to the bus'),
+    'flesh_bytes_in_total': ('counter', 'Bytes read from the bus'),
+    'flesh_queue_wait_seconds': ('histogram', 'Time commands waited for the I/O thread, per priority'),
+    'flesh_schedule_lateness_seconds': ('histogram', 'How late scheduled ticks ran after their deadline'),
+    'flesh_frames_total': ('counter', 'Reply frames decoded'),
+    'flesh_checksum_errors_total': ('counter', 'Reply frames rejected by the checksum'),
+    'flesh_dropped_bytes_total': ('counter', 'Bytes discarded while resynchronising'),
+}
+
+
+# Label tuple for a request: command type and actuator
+def command_labels(cmd, id):
+    return (('cmd', COMMAND_NAMES.get(cmd, f'0x{cmd:02x}')), ('id', str(id)))
+
+
+class Histogram:
+    """Fixed-bucket histogram, counts[i] holds the values <= buckets[i] (the last one the rest)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Upper bound of the bucket holding quantile q, None when empty (inf past the last bucket)
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Registry of labelled counters and histograms.
+
+    Labels are tuples of (name, value) pairs. Collectors are callables run
+    at read time that return (name, labels, value) counters, for numbers
+    that are already counted elsewhere (e.g. the decoders' error counts).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, labels=(), n=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name, value, labels=(), buckets=RTT_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # Outcome of one request: its round-trip time, or a timeout when no reply came
+    def request(self, cmd, id, ok, rtt):
+        if ok:
+            self.observe('flesh_rtt_seconds', rtt, command_labels(cmd, id))
+        else:
+            self.inc('flesh_timeouts_total', command_labels(cmd, id))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _counter_items(self):
+        with self._lock:
+            items = list(self._counters.items())
+        for collector in self._collectors:
+            items.extend(((name, labels), value) for name, labels, value in collector())
+        return items
+
+    def _histogram_items(self):
+        with self._lock:
+            return [(key, _copy(h)) for key, h in self._histograms.items()]
+
+    # Plain dict of every metric, keys are Prometheus-style series names
+    def snapshot(self):
+        counters = {_series(name, labels): value for (name, labels), value in self._counter_items()}
+        histograms = {}
+        for (name, labels), h in self._histogram_items():
+            histograms[_series(name, labels)] = {
+                'count': h.count,
+                'sum': h.sum,
+                'mean': h.sum / h.count if h.count else None,
+                'p50': h.quantile(0.5),
+                'p99': h.quantile(0.99),
+                'buckets': dict(zip(map(str, h.buckets + (float('inf'),)), h.counts)),
+            }
+        return {'counters': counters, 'histograms': histograms}
+
+    # Prometheus text exposition format
+    def render(self):
+        series = {}
+        for (name, labels), value in self._counter_items():
+            series.setdefault(name, []).append(f'{_series(name, labels)} {value}')
+        for (name, labels), h in self._histogram_items():
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, n in zip(h.buckets + (float('inf'),), h.counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{_series(name + '_bucket', labels + (('le', le),))} {cumulative}")
+            lines.append(f"{_series(name + '_sum', labels)} {h.sum}")
+            lines.append(f"{_series(name + '_count', labels)} {h.count}")
+        out = []
+        for name in sorted(series):
+            kind, text = DESCRIPTIONS.get(name, ('untyped', name))
+            out.append(f'# HELP {name} {text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(series[name])
+        return '\n'.join(out) + '\n'
+
+
+def _copy(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.count = histogram.count
+    copy.sum = histogram.sum
+    return copy
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+# Process-wide registry the transport, poller and worker report to
+METRICS = Metrics()
+
+
+# Serve /metrics (Prometheus text) and /snapshot (JSON) on a daemon thread, returns the server
+# http.server and json are imported here, so 'import flesh' does not pay for them
+def serve(port=DEFAULT_PORT, host='127.0.0.1', metrics=METRICS):
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, kind = metrics.render(), 'text/plain; version=0.0.4'
+            elif self.path == '/snapshot':
+                body, kind = json.dumps(metrics.snapshot(), indent=2), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', kind)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes are not worth a line on the console each
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='flesh-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,120 @@
+## Motion completion futures
+## Instead of sleeping a fixed time (or a second between polling sweeps) and
+## hoping the hand got there, watch() polls the moving actuators at a high rate
+## and resolves a Future as soon as every one of them has either reached its
+## target, stalled against something (no longer moving while its current or
+## force has risen) or run out of time.
+
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+from flesh.scheduler import Scheduler, SKIP
+
+REACHED = 'reached'         # Within tolerance of the target
+STALLED = 'stalled'         # Stopped short of the target with rising current or force, e.g. gripping an object
+TIMEOUT = 'timeout'         # Neither before the deadline
+STOPPED = 'stopped'         # The watch was stopped first
+
+DEFAULT_TOLERANCE = 10      # Position units from the target that count as reached
+DEFAULT_TIMEOUT = 5.0       # Seconds
+POLL_PERIOD = 0.01          # Status sweep period while watching
+STALL_WINDOW = 0.1          # Seconds an actuator must stay put to count as stalled
+STALL_DISTANCE = 3          # Position units it may move within the window and still count as put
+CURRENT_RISE = 20           # mA above the lowest current seen during the move that counts as loading
+FORCE_RISE = 5              # Force units above the lowest force seen during the move that counts as loading
+
+
+class MotionResult(namedtuple('MotionResult', ['outcomes', 'statuses', 'elapsed'])):
+    """How a watched motion ended: {id: outcome}, the last {id: Status} and the seconds it took."""
+
+    # True if every actuator reached its target
+    @property
+    def reached(self):
+        return all(outcome == REACHED for outcome in self.outcomes.values())
+
+
+class MotionTracker:
+    """Decides from successive status samples when each actuator's motion is over."""
+
+    def __init__(self, targets, tolerance=DEFAULT_TOLERANCE, stall_window=STALL_WINDOW,
+                 stall_distance=STALL_DISTANCE, current_rise=CURRENT_RISE, force_rise=FORCE_RISE):
+        self.targets = dict(targets)
+        self.tolerance = tolerance
+        self.stall_window = stall_window
+        self.stall_distance = stall_distance
+        self.current_rise = current_rise
+        self.force_rise = force_rise
+        self.outcomes = {}          # id -> REACHED or STALLED once decided
+        self.statuses = {}          # id -> last Status
+        self._history = {id: deque() for id in self.targets}  # (t, pos) within the stall window
+        self._floor = {}            # id -> lowest (current, force) seen
+
+    # Actuators not decided yet
+    def pending(self):
+        return tuple(id for id in self.targets if id not in self.outcomes)
+
+    # Take in a sweep {id: Status or None} sampled at `now`, returns the ids still pending
+    def update(self, statuses, now=None):
+        if now is None:
+            now = time.monotonic()
+        for id, status in statuses.items():
+            if status is None or id not in self.targets or id in self.outcomes:
+                continue
+            self.statuses[id] = status
+            if abs(status.current_pos - self.targets[id]) <= self.tolerance:
+                self.outcomes[id] = REACHED
+                continue
+            current, force = self._floor.get(id, (status.current, status.force))
+            self._floor[id] = (min(current, status.current), min(force, status.force))
+            history = self._history[id]
+            history.append((now, status.current_pos))
+            while now - history[0][0] > self.stall_window:
+                history.popleft()
+            if self._stalled(id, status, history, now):
+                self.outcomes[id] = STALLED
+        return self.pending()
+
+    def _stalled(self, id, status, history, now):
+        if len(history) < 2 or now - history[0][0] < self.stall_window * 0.9:
+            return False  # Not watched for a whole window yet
+        positions = [pos for _, pos in history]
+        if max(positions) - min(positions) > self.stall_distance:
+            return False
+        current, force = self._floor[id]
+        return status.current - current >= self.current_rise or status.force - force >= self.force_rise
+
+    def result(self, elapsed, unfinished=TIMEOUT):
+        outcomes = {id: self.outcomes.get(id, unfinished) for id in self.targets}
+        return MotionResult(outcomes, dict(self.statuses), elapsed)
+
+
+# Watch actuators move to targets {id: position} and return a Future for the MotionResult
+# poll(ids) returns a sweep {id: Status or None}, e.g. Hand.status_all, or a function that
+# goes through the I/O worker; it is called from a watcher thread every `period` seconds
+# with the actuators still pending. Setting `stop` ends the watch early (outcome STOPPED)
+def watch(poll, targets, tolerance=DEFAULT_TOLERANCE, timeout=DEFAULT_TIMEOUT, period=POLL_PERIOD,
+          stop=None, **stall):
+    future = Future()
+    future.set_running_or_notify_cancel()
+    tracker = MotionTracker(targets, tolerance, **stall)
+    stop = stop or threading.Event()
+    scheduler = Scheduler('motion', SKIP, stop)
+    start = time.monotonic()
+
+    def tick(_):
+        if stop.is_set() or time.monotonic() - start > timeout:
+            return False
+        return bool(tracker.update(poll(tracker.pending())))
+
+    def run():
+        try:
+            scheduler.every(period, tick)
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        future.set_result(tracker.result(time.monotonic() - start, STOPPED if stop.is_set() else TIMEOUT))
+
+    threading.Thread(target=run, name='flesh-motion', daemon=True).start()
+    return future
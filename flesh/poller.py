@@ -0,0 +1,236 @@
+## Pipelined status polling
+## Status queries for several actuators are sent back to back and the replies
+## are matched to actuators by their ID byte, so a sweep of the hand costs
+## roughly one round trip instead of one round trip per actuator.
+## AdaptivePoller decides which actuators a sweep should include, polling the
+## moving or loading fingers fast and the settled ones at a slow heartbeat.
+
+import threading
+import time
+from functools import lru_cache
+
+from flesh.protocol import CMD_MC, is_status, parse_status
+from flesh.encoder import status_query
+from flesh import trace
+from flesh.metrics import METRICS
+from flesh.transport import DEFAULT_TIMEOUT, decoder_for, transact_frame, set_timeout, send
+
+ACTUATOR_IDS = (1, 2, 3, 4, 5)
+
+
+# Concatenated status queries for a tuple of ids, built once
+@lru_cache(maxsize=None)
+def status_queries(ids):
+    return b''.join(status_query(id) for id in ids)
+
+
+# Query the status of every actuator in ids with at most `window` queries in flight
+# (None sends them all in a single write). Returns {id: Status or None}.
+# Actuators that did not answer before the deadline are retried one at a time
+# `retries` times before being reported as None.
+def poll_status(ser, ids=ACTUATOR_IDS, window=None, timeout=DEFAULT_TIMEOUT, retries=1):
+    ids = tuple(ids)
+    start = trace.now() if trace.enabled else 0
+    decoder = decoder_for(ser)
+    results = dict.fromkeys(ids)
+    waiting = set(ids)
+
+    # Status replies parked by earlier transactions, or already waiting on the port before the
+    # queries go out, are late answers to an older sweep and not current telemetry
+    if ser.in_waiting:
+        decoder.pending.extend(decoder.feed(ser.read(ser.in_waiting)))
+    decoder.discard(lambda f: f.id in waiting and is_status(f))
+
+    queue = list(ids)
+    sent_at = {}  # id -> time its query went out, for the round-trip metrics
+    if not queue:
+        sent = 0
+    elif window is None or window >= len(queue):
+        send(ser, status_queries(tuple(queue)))
+        sent = len(queue)
+    else:
+        send(ser, status_queries(tuple(queue[:window])))
+        sent = window
+    now = time.monotonic()
+    for id in queue[:sent]:
+        sent_at[id] = now
+    in_flight = sent
+
+    deadline = time.monotonic() + timeout
+    set_timeout(ser)
+    while waiting and time.monotonic() < deadline:
+        chunk = ser.read(max(decoder.needed() or 3, ser.in_waiting))
+        if not chunk:
+            continue
+        METRICS.inc('flesh_bytes_in_total', (), len(chunk))
+        now = time.monotonic()
+        for frame in decoder.feed(chunk):
+            if frame.id in waiting and is_status(frame):
+                results[frame.id] = parse_status(frame)
+                waiting.discard(frame.id)
+                in_flight -= 1
+                METRICS.request(CMD_MC, frame.id, True, now - sent_at.get(frame.id, now))
+            else:
+                decoder.pending.append(frame)
+        # Keep the window full as replies come back
+        if sent < len(queue) and in_flight < window:
+            more = queue[sent:sent + window - in_flight]
+            send(ser, status_queries(tuple(more)))
+            now = time.monotonic()
+            for id in more:
+                sent_at[id] = now
+            sent += len(more)
+            in_flight += len(more)
+    if waiting and decoder.needed():
+        METRICS.inc('flesh_short_reads_total')
+        decoder.pending.extend(decoder.skip())
+    for id in waiting:
+        if id in sent_at:
+            METRICS.request(CMD_MC, id, False, 0.0)
+
+    # Fall back to plain transactions for actuators that stayed silent
+    for _ in range(retries):
+        for id in sorted(waiting):
+            frame = transact_frame(ser, status_query(id), lambda f: f.id == id and is_status(f), timeout)
+            if frame is not None:
+                results[id] = parse_status(frame)
+                waiting.discard(id)
+    if start:
+        trace.complete('poll_status', 'bus', start, ids=list(ids), missing=sorted(waiting))
+    return results
+
+
+class AdaptivePoller:
+    """Per-actuator poll scheduling within a bus budget.
+
+    An actuator is active while it has no sample yet, is away from its
+    target, moved since its last sample or its force is rising; active
+    actuators are polled every `fast_period`, settled ones every
+    `slow_period`. An actuator that misses `miss_limit` replies in a row is
+    backed off from `slow_period` doubling up to `max_backoff`, since every
+    miss holds the bus for its deadline and retry; new targets take the
+    backoff back to `slow_period`. `budget` caps the status polls per
+    second for the whole bus, a miss counting as the polls that would fit
+    in `miss_time`: when the active actuators would exceed what the
+    heartbeats and misses leave, their period is stretched to share the rest.
+
+    Targets come from set_targets(), called by whoever sends the positions.
+    One thread runs due()/update()/wait(), set_targets() may be called from
+    any thread and wakes it.
+    """
+
+    def __init__(self, ids=ACTUATOR_IDS, budget=250, fast_period=0.02, slow_period=0.5,
+                 tolerance=10, force_rise=5, miss_time=2 * DEFAULT_TIMEOUT, miss_limit=3, max_backoff=8.0):
+        self.ids = tuple(ids)
+        self.budget = budget                # Status polls per second for the whole bus
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self.tolerance = tolerance          # Position units counted as settled / not moving
+        self.force_rise = force_rise        # Force increase between samples that counts as loading
+        self.miss_time = miss_time          # Bus seconds a missed reply costs, the deadline plus the retry in poll_status
+        self.miss_limit = max(miss_limit, 1)  # Replies missed in a row before an actuator is backed off
+        self.max_backoff = max_backoff      # Longest poll period of an actuator that keeps missing
+        self._targets = {}
+        self._last = {}                     # id -> last Status
+        self._active = dict.fromkeys(self.ids, True)
+        self._next = dict.fromkeys(self.ids, 0.0)  # id -> time.monotonic() the next poll is due
+        self._misses = dict.fromkeys(self.ids, 0)  # id -> replies missed in a row
+        self._kick = threading.Event()
+        self.polls = 0
+
+    # Record new target positions for actuators ids[0], ids[1], ... and poll them right away
+    # A backed-off actuator is asked again within slow_period instead, so a stream of new targets
+    # does not bring back the timeouts of one that is gone
+    def set_targets(self, positions, now=None):
+        if now is None:
+            now = time.monotonic()
+        for id, target in zip(self.ids, positions):
+            if self._targets.get(id) != target:
+                self._targets[id] = target
+                if self.backed_off(id):
+                    self._misses[id] = self.miss_limit
+                    self._next[id] = min(self._next[id], now + self.slow_period)
+                else:
+                    self._active[id] = True
+                    self._next[id] = 0.0
+        self._kick.set()
+
+    # True if the actuator missed too many replies in a row to be polled at its normal period
+    def backed_off(self, id):
+        return self._misses[id] >= self.miss_limit
+
+    # Poll period of an actuator that missed its last `misses` replies (miss_limit or more)
+    def backoff(self, misses):
+        return min(self.slow_period * 2 ** (misses - self.miss_limit), max(self.max_backoff, self.slow_period))
+
+    # Time.monotonic() the next poll of an actuator is due
+    def next_poll(self, id):
+        return self._next[id]
+
+    # Poll period of active and of settled actuators under the budget
+    def periods(self):
+        missing = [self._misses[id] for id in self.ids if self.backed_off(id)]
+        active = sum(self._active.values())
+        slow = self.slow_period
+        fast = self.fast_period
+        if active:
+            settled = len(self.ids) - active - len(missing)
+            spare = (self.budget - settled / slow
+                     - sum(self.miss_time * self.budget / self.backoff(misses) for misses in missing))
+            fast = max(fast, active / spare) if spare > 0 else slow
+        return min(fast, slow), slow
+
+    # Actuators due for a poll at `now`, in id order
+    def due(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        return tuple(id for id in self.ids if self._next[id] <= now)
+
+    # Take in the results of a sweep {id: Status or None} polled at `now`
+    def update(self, statuses, now=None):
+        if now is None:
+            now = time.monotonic()
+        for id, status in statuses.items():
+            if id not in self._active:
+                continue
+            self.polls += 1
+            if status is None:
+                self._misses[id] += 1
+                if self.backed_off(id):
+                    self._active[id] = False  # Backed off below instead of holding the bus every fast period
+            else:
+                self._misses[id] = 0
+                previous = self._last.get(id)
+                target = self._targets.get(id)
+                self._active[id] = (previous is None
+                                    or (target is not None and abs(status.current_pos - target) > self.tolerance)
+                                    or abs(status.current_pos - previous.current_pos) > self.tolerance
+                                    or status.force - previous.force > self.force_rise)
+                self._last[id] = status
+        fast, slow = self.periods()
+        for id in statuses:
+            if id in self._active:
+                if self.backed_off(id):
+                    self._next[id] = now + self.backoff(self._misses[id])
+                else:
+                    self._next[id] = now + (fast if self._active[id] else slow)
+
+    # Actuators currently polled at the fast rate
+    def active(self):
+        return tuple(id for id in self.ids if self._active[id])
+
+    # Sleep until the next actuator is due or set_targets() is called
+    def wait(self):
+        delay = min(self._next.values()) - time.monotonic()
+        if delay > 0:
+            self._kick.wait(delay)
+        self._kick.clear()
+
+    # Poll whatever is due on ser and take in the results, returns {id: Status or None} for the polled ids
+    def poll(self, ser, timeout=DEFAULT_TIMEOUT):
+        ids = self.due()
+        if not ids:
+            return {}
+        statuses = poll_status(ser, ids, timeout=timeout)
+        self.update(statuses)
+        return statuses
@@ -0,0 +1,68 @@
+## Frame layout and typed frames for the 0x55 0xAA / 0xAA 0x55 actuator protocol
+##
+## Request: 55 AA | len | id | cmd | ...      | checksum
+## Reply:   AA 55 | len | id | cmd | payload  | checksum
+## len counts the bytes between the id and the checksum, the checksum is the
+## low byte of the sum of everything from len up to (not including) itself.
+
+import struct
+from collections import namedtuple
+
+TX_HEADER = b'\x55\xAA'     # Request frame header
+RX_HEADER = b'\xAA\x55'     # Reply frame header
+FRAME_OVERHEAD = 5          # header(2) + len(1) + id(1) + checksum(1)
+READ_REQUEST_LEN = 8        # Read requests are 8 bytes whatever their length byte says
+
+CMD_RD = 0x01               # Read register command flag
+CMD_WR = 0x02               # Write register command flag
+CMD_MC = 0x04               # Single control command
+QUERY_STATUS = 0x22         # CMD_MC parameter: query actuator status
+BROADCAST_ID = 0xFF         # Broadcast ID
+CMD_BROADCAST_POS = 0xF2    # Broadcast positioning flag
+
+STATUS_REPLY_LEN = 22       # Reply length for the 0x04 0x22 status query
+MAX_READ = 64               # Most registers one read request may fetch
+MAX_LEN = MAX_READ + 2      # Largest reply length byte, a MAX_READ register read (cmd, address, values)
+STATUS_FIELDS = struct.Struct('<hbHh')  # current_pos, temp, current, force at offset 9
+
+# A checked reply frame: payload is everything between cmd and checksum
+Frame = namedtuple('Frame', ['id', 'cmd', 'payload', 'raw'])
+
+# Decoded status query reply
+Status = namedtuple('Status', ['id', 'current_pos', 'temp', 'current', 'force'])
+
+
+# Checksum over len..last data byte of a frame
+def checksum(frame, end=None):
+    return sum(frame[2:end]) & 0xFF
+
+
+# Size of the request frame starting at buf[pos] (its header, len and cmd bytes must be present)
+def request_length(buf, pos=0):
+    return READ_REQUEST_LEN if buf[pos + 4] == CMD_RD else buf[pos + 2] + FRAME_OVERHEAD
+
+
+# True if raw reply bytes are a status query reply (a 15-register read reply has the same length)
+def is_status_reply(raw):
+    return len(raw) == STATUS_REPLY_LEN and raw[4] == CMD_MC and raw[6] == QUERY_STATUS
+
+
+# True if the frame is a status query reply
+def is_status(frame):
+    return is_status_reply(frame.raw)
+
+
+# Decode a status query reply frame into a Status tuple
+def parse_status(frame):
+    current_pos, temp, current, force = STATUS_FIELDS.unpack_from(frame.raw, 9)
+    return Status(frame.id, current_pos, temp, current, force)
+
+
+# True if a write register reply acknowledges a write at add (payload: address, 0x01 on success)
+def write_acknowledged(frame, add):
+    return len(frame.payload) >= 2 and frame.payload[0] == add and frame.payload[-1] == 0x01
+
+
+# Register values carried by a read register reply (payload starts with the address)
+def register_values(frame):
+    return list(frame.payload[1:])
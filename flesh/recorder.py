@@ -0,0 +1,243 @@
+## Compact binary recorder for bus traffic and telemetry
+## Every request written and every reply decoded on a port becomes one
+## fixed-size record in a memory-mapped, pre-extended log file: monotonic
+## timestamp, direction, actuator id, command, decoded status fields and the
+## raw frame. Logs rotate by size and load back as a NumPy array without copying.
+##
+## Segment layout: a 64-byte header (magic, version, record size, record count,
+## wall and monotonic clocks at creation) followed by `count` packed records.
+## The count is only advanced after the records it covers are written, so a
+## log can be read while it is still being recorded.
+##
+## python -m flesh.recorder endurance.0000.flrec prints a summary of a log.
+
+import argparse
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from flesh.protocol import TX_HEADER, FRAME_OVERHEAD, MAX_LEN, STATUS_FIELDS, is_status_reply, request_length
+from flesh.transport import decoder_for, add_send_tap, remove_send_tap
+
+MAGIC = b'FLESHREC'
+VERSION = 2                 # 1 kept only 32 raw bytes
+HEADER = struct.Struct('<8sHHQdd')  # magic, version, record size, count, time.time(), time.monotonic()
+HEADER_SIZE = 64
+SUFFIX = '.flrec'
+
+KIND_REPLY = 0              # Reply frame that is not a status reply
+KIND_STATUS = 1             # Status reply, pos/temp/current/force are filled in
+KIND_COMMAND = 2            # Request frame written to the bus
+RAW_SIZE = MAX_LEN + FRAME_OVERHEAD  # Raw frame bytes kept (the longest reply), raw_len has the real length of longer frames
+
+RECORD = struct.Struct(f'<dBBBhbHhB{RAW_SIZE}s')
+RECORD_DTYPE = np.dtype([
+    ('t', '<f8'),           # time.monotonic() when the frame was sent or decoded
+    ('kind', 'u1'),         # KIND_REPLY, KIND_STATUS or KIND_COMMAND
+    ('id', 'u1'),
+    ('cmd', 'u1'),
+    ('pos', '<i2'),
+    ('temp', 'i1'),
+    ('current', '<u2'),
+    ('force', '<i2'),
+    ('raw_len', 'u1'),
+    ('raw', 'u1', (RAW_SIZE,)),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+DEFAULT_SEGMENT_BYTES = 64 << 20    # About 750000 records per file
+
+
+# File name of segment n of a recording
+def segment_path(prefix, n):
+    return f'{prefix}.{n:04d}{SUFFIX}'
+
+
+# Segment files of a recording in order
+def segments(prefix):
+    return sorted(glob.glob(glob.escape(prefix) + '.[0-9][0-9][0-9][0-9]' + SUFFIX))
+
+
+# Header of a segment as a dict
+def read_header(path):
+    with open(path, 'rb') as f:
+        magic, version, record_size, count, wall, mono = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a FLESH recording')
+    if version != VERSION or record_size != RECORD.size:
+        raise ValueError(f'{path} has record format {version}/{record_size}, expected {VERSION}/{RECORD.size}')
+    return {'count': count, 'wall_time': wall, 'monotonic': mono}
+
+
+# The records of one segment as a read-only memory-mapped array, nothing is copied
+def load(path):
+    count = read_header(path)['count']
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+# All segments of a recording in one array (this one is a copy)
+def load_all(prefix):
+    parts = [load(path) for path in segments(prefix)]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+
+
+# Raw frame bytes of one record
+def raw_frame(record):
+    return bytes(record['raw'][:min(record['raw_len'], RAW_SIZE)])
+
+
+class Recorder:
+    """Records bus traffic of attached ports into rotating memory-mapped logs.
+
+    The capture taps only append (timestamp, direction, bytes) to a deque, the
+    decoding and writing happen on a background thread, so recording never
+    blocks the thread talking to the hand. Records are flushed every
+    `interval` seconds and a new segment is started once a file holds
+    `segment_bytes`.
+    """
+
+    def __init__(self, prefix, segment_bytes=DEFAULT_SEGMENT_BYTES, interval=0.05):
+        if prefix.endswith(SUFFIX):
+            prefix = prefix[:-len(SUFFIX)]
+        self.prefix = prefix
+        self.capacity = max((segment_bytes - HEADER_SIZE) // RECORD.size, 1)
+        self.interval = interval
+        self.records = 0            # Records written over all segments
+        self.segment = -1
+        self._queue = deque()
+        self._ports = []
+        self._file = None
+        self._map = None
+        self._count = 0
+        self._stop = threading.Event()
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='flesh-recorder', daemon=True)
+        self._thread.start()
+
+    # Record everything sent and received on a serial port
+    def attach(self, ser):
+        decoder_for(ser).taps.append(self.on_frame)
+        add_send_tap(ser, self.on_send)
+        self._ports.append(ser)
+
+    def detach(self, ser):
+        taps = decoder_for(ser).taps
+        if self.on_frame in taps:
+            taps.remove(self.on_frame)
+        remove_send_tap(ser, self.on_send)
+        if ser in self._ports:
+            self._ports.remove(ser)
+
+    # Decoder tap, called on the I/O thread
+    def on_frame(self, frame):
+        self._queue.append((time.monotonic(), False, frame.raw))
+
+    # Send tap, called on the I/O thread (encoders reuse their buffers, so keep a copy)
+    def on_send(self, request):
+        self._queue.append((time.monotonic(), True, bytes(request)))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._drain()
+        self._drain()
+
+    # Write out everything queued so far, then publish the new count
+    def _drain(self):
+        queue = self._queue
+        while queue:
+            t, sent, data = queue.popleft()
+            if sent:
+                # One write may carry several requests, e.g. a pipelined status sweep
+                pos = 0
+                while pos + 5 <= len(data) and data[pos:pos + 2] == TX_HEADER:
+                    size = request_length(data, pos)
+                    self._write(t, KIND_COMMAND, data[pos + 3], data[pos + 4], None, data[pos:pos + size])
+                    pos += size
+            elif is_status_reply(data):
+                self._write(t, KIND_STATUS, data[3], data[4], STATUS_FIELDS.unpack_from(data, 9), data)
+            else:
+                self._write(t, KIND_REPLY, data[3], data[4], None, data)
+        self._publish()
+
+    def _write(self, t, kind, id, cmd, fields, raw):
+        if self._count == self.capacity:
+            self._rotate()
+        pos, temp, current, force = fields or (0, 0, 0, 0)
+        RECORD.pack_into(self._map, HEADER_SIZE + self._count * RECORD.size,
+                         t, kind, id, cmd, pos, temp, current, force, min(len(raw), 255), raw[:RAW_SIZE])
+        self._count += 1
+        self.records += 1
+
+    def _publish(self):
+        struct.pack_into('<Q', self._map, 12, self._count)
+
+    def _open_segment(self):
+        self.segment += 1
+        self.path = segment_path(self.prefix, self.segment)
+        size = HEADER_SIZE + self.capacity * RECORD.size
+        self._file = open(self.path, 'w+b')
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(self._file.fileno(), 0, size)  # Reserve the blocks now, not on first touch
+        else:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._count = 0
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size, 0, time.time(), time.monotonic())
+
+    # Trim the finished segment to the records it holds
+    def _close_segment(self):
+        self._publish()
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(HEADER_SIZE + self._count * RECORD.size)
+        self._file.close()
+
+    def _rotate(self):
+        self._close_segment()
+        self._open_segment()
+
+    # Stop capturing, write what is queued and close the current segment
+    def close(self):
+        for ser in list(self._ports):
+            self.detach(ser)
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+            self._close_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise a FLESH recording')
+    parser.add_argument('path', help='segment file, or the recording prefix for all segments')
+    args = parser.parse_args()
+    records = load(args.path) if os.path.exists(args.path) else load_all(args.path)
+    print(f'{len(records)} records')
+    if not len(records):
+        return
+    print(f"{records['t'][-1] - records['t'][0]:.3f} s, "
+          f"{np.count_nonzero(records['kind'] == KIND_COMMAND)} commands, "
+          f"{np.count_nonzero(records['kind'] == KIND_STATUS)} status replies")
+    status = records[records['kind'] == KIND_STATUS]
+    for id in np.unique(status['id']):
+        rows = status[status['id'] == id]
+        print(f"Actuator {id}: {len(rows)} samples, pos {rows['pos'].min()}..{rows['pos'].max()}, "
+              f"max current {rows['current'].max()}, max force {rows['force'].max()}, "
+              f"max temp {rows['temp'].max()}")
+
+
+if __name__ == '__main__':
+    main()
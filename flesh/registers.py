@@ -0,0 +1,328 @@
+## Per-actuator register mirror
+## Register reads go through a byte-level copy of each actuator's register
+## file. Every register has a volatility class that decides how long a value
+## read from the device stays valid: static settings until they are written,
+## configuration for a while, live sensor values only briefly. Whatever is
+## missing or expired is fetched with the fewest multi-register reads that
+## cover it, so inspecting a hand's configuration costs one or two round trips
+## instead of one per register and repeated queries cost none.
+##
+## Writes go through the same mirror. A register write whose whole payload
+## the device already holds is not sent, the others are marked dirty and
+## flushed complete and at their own address in the fewest write frames
+## (neighbouring registers share a frame when only named settings lie
+## between them), and only writes the actuator acknowledged are taken into
+## the mirror.
+##
+## python -m flesh.registers COM10 prints the register map of every actuator,
+## --set overCurproSet=600 applies a setting to all of them first.
+
+import argparse
+import time
+from collections import namedtuple
+
+from flesh.client import regdict, Hand, POSITION_REGISTERS, position_payload
+from flesh.protocol import MAX_READ
+
+STATIC = 'static'           # Only changes when written (ID, baud rate)
+CONFIG = 'config'           # Settings, may be changed by other tools now and then
+LIVE = 'live'               # Sensor and motion values
+DEFAULT_TTL = {STATIC: None, CONFIG: 30.0, LIVE: 0.05}  # Seconds a read value stays valid, None for ever
+
+REGISTER_SPACE = 256        # Addresses per actuator
+MAX_WRITE = 64              # Most registers written by one write request
+
+# Layout of a named register: size in bytes, signedness and volatility class
+Register = namedtuple('Register', ['address', 'size', 'signed', 'volatility'])
+
+REGISTERS = {
+    'ID'              : Register(regdict['ID'], 1, False, STATIC),
+    'baudrate'        : Register(regdict['baudrate'], 1, False, STATIC),
+    'curLocat'        : Register(regdict['curLocat'], 2, False, LIVE),
+    'zeroCalibra'     : Register(regdict['zeroCalibra'], 1, False, CONFIG),
+    'overCurproSet'   : Register(regdict['overCurproSet'], 2, False, CONFIG),
+    'tarLocatSet'     : Register(regdict['tarLocatSet'], 2, False, LIVE),   # Moved by every broadcast
+    'fSensorDada'     : Register(regdict['fSensorDada'], 2, True, LIVE),
+    'fOriginalValue'  : Register(regdict['fOriginalValue'], 2, True, LIVE),
+    'forceAct'        : Register(regdict['forceAct'], 2, False, CONFIG),
+    'warmUpSta'       : Register(regdict['warmUpSta'], 1, False, CONFIG),
+}
+
+
+# Fewest (address, count) reads of at most max_read registers covering the sorted addresses
+# Greedy from the lowest address, which is optimal for covering points with fixed-length spans
+def plan_reads(addresses, max_read=MAX_READ):
+    reads = []
+    start = last = None
+    for add in addresses:
+        if start is not None and add - start < max_read:
+            last = add
+            continue
+        if start is not None:
+            reads.append((start, last - start + 1))
+        start = last = add
+    if start is not None:
+        reads.append((start, last - start + 1))
+    return reads
+
+
+# Fewest writes of at most max_write registers covering the (address, size) payloads sorted by address,
+# as (address, count, [payload addresses]). A payload is never split or overlapped by another in the
+# same write, and gaps between payloads are only bridged where known(address) says the mirror holds
+# the device value
+def plan_writes(payloads, known, max_write=MAX_WRITE):
+    writes = []
+    start = end = None
+    parts = []
+    for add, size in payloads:
+        if (start is not None and add >= end and add + size - start <= max_write
+                and all(known(a) for a in range(end, add))):
+            end = add + size
+            parts.append(add)
+            continue
+        if start is not None:
+            writes.append((start, end - start, parts))
+        start, end, parts = add, add + size, [add]
+    if start is not None:
+        writes.append((start, end - start, parts))
+    return writes
+
+
+# Address and payload of a named register write: POSITION_REGISTERS take three copies, the rest their REGISTERS size
+def register_payload(name, value):
+    if name in POSITION_REGISTERS:
+        return position_payload(name, value)
+    register = REGISTERS[name]
+    return register.address, list(value.to_bytes(register.size, 'little', signed=register.signed))
+
+
+# Addresses a write may rewrite with their mirror value to join two payloads into one frame: the
+# bytes of named static and config registers, never live values or registers nobody has named
+BRIDGEABLE = frozenset(a for name, register in REGISTERS.items() if register.volatility != LIVE
+                       for a in range(register.address, register.address + len(register_payload(name, 0)[1])))
+
+
+class RegisterCache:
+    """Register mirror for the actuators of one Hand.
+
+    read()/get()/snapshot() answer from the mirror and fetch only what is
+    missing or older than its class TTL (or than max_age when given).
+    write()/write_position()/apply() only send the register writes whose
+    payload differs from what the mirror knows the device holds. Like the
+    Hand it is not thread-safe, use it from the thread that owns the hand.
+    """
+
+    def __init__(self, hand, ttl=None, max_read=MAX_READ, max_write=MAX_WRITE):
+        self.hand = hand
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.max_read = max_read
+        self.max_write = max_write
+        self._ttl = [self.ttl[CONFIG]] * REGISTER_SPACE   # TTL of every address
+        for register in REGISTERS.values():
+            for add in range(register.address, register.address + register.size):
+                self._ttl[add] = self.ttl[register.volatility]
+        self._values = {}           # id -> bytearray mirror of the register file
+        self._fetched = {}          # id -> time.monotonic() each address was last read or written, None if never
+        self._dirty = {}            # id -> {address: payload} staged but not yet acknowledged, in staging order
+        self.hits = 0               # Requests answered without touching the bus
+        self.misses = 0
+        self.reads = 0              # Read transactions sent
+        self.bytes_read = 0
+        self.writes = 0             # Write transactions sent
+        self.bytes_written = 0
+        self.skipped = 0            # Staged payloads that matched the device and sent nothing
+
+    def _mirror(self, id):
+        if id not in self._values:
+            self._values[id] = bytearray(REGISTER_SPACE)
+            self._fetched[id] = [None] * REGISTER_SPACE
+        return self._values[id], self._fetched[id]
+
+    # True if the mirror holds a value of add that is not older than its TTL
+    def _known(self, fetched, add, now):
+        t = fetched[add]
+        return t is not None and (self._ttl[add] is None or now - t <= self._ttl[add])
+
+    # Addresses of the ranges that are missing or expired, sorted
+    def stale(self, id, ranges, max_age=None, now=None):
+        if now is None:
+            now = time.monotonic()
+        fetched = self._mirror(id)[1]
+        ttl = self._ttl
+        stale = set()
+        for add, num in ranges:
+            for a in range(add, add + num):
+                t = fetched[a]
+                limit = ttl[a] if max_age is None else max_age
+                if t is None or (limit is not None and now - t > limit):
+                    stale.add(a)
+        return sorted(stale)
+
+    # Make sure the (address, count) ranges are in the mirror, True if every needed read succeeded
+    def fill(self, id, ranges, max_age=None):
+        return not self._refresh(id, ranges, max_age)
+
+    # Read what is missing or expired in the ranges, returns the set of addresses whose read failed
+    def _refresh(self, id, ranges, max_age=None):
+        stale = self.stale(id, ranges, max_age)
+        if not stale:
+            self.hits += 1
+            return set()
+        self.misses += 1
+        values, fetched = self._mirror(id)
+        failed = set()
+        for add, num in plan_reads(stale, self.max_read):
+            data = self.hand.read_register(id, add, num)
+            self.reads += 1
+            if len(data) < num:
+                failed.update(range(add, add + num))
+                continue
+            now = time.monotonic()
+            values[add:add + num] = bytes(data[:num])
+            fetched[add:add + num] = [now] * num
+            self.bytes_read += num
+        return failed
+
+    # num register bytes from add, None if the device did not answer
+    def read(self, id, add, num, max_age=None):
+        if not self.fill(id, [(add, num)], max_age):
+            return None
+        return bytes(self._values[id][add:add + num])
+
+    # Value of a named register (see REGISTERS), None if the device did not answer
+    def get(self, id, name, max_age=None):
+        register = REGISTERS[name]
+        data = self.read(id, register.address, register.size, max_age)
+        return None if data is None else int.from_bytes(data, 'little', signed=register.signed)
+
+    # Values of several named registers, fetched together: {name: value or None}
+    def snapshot(self, id, names=None, max_age=None):
+        registers = {name: REGISTERS[name] for name in (names or REGISTERS)}
+        failed = self._refresh(id, [(r.address, r.size) for r in registers.values()], max_age)
+        values = self._mirror(id)[0]
+        out = {}
+        for name, register in registers.items():
+            span = slice(register.address, register.address + register.size)
+            if not failed.isdisjoint(range(span.start, span.stop)):
+                out[name] = None  # Its read failed, the mirror only has an expired value if any
+            else:
+                out[name] = int.from_bytes(values[span], 'little', signed=register.signed)
+        return out
+
+    # Forget cached values of one actuator (or all), optionally only num registers from add
+    def invalidate(self, id=None, add=0, num=REGISTER_SPACE):
+        for key in ([id] if id is not None else list(self._fetched)):
+            if key in self._fetched:
+                self._fetched[key][add:add + num] = [None] * num
+
+    # Queue a register write of data at add, dropped if the device is known to hold all of it already
+    # Returns the number of payloads left dirty for the next flush()
+    def stage(self, id, add, data):
+        values, fetched = self._mirror(id)
+        dirty = self._dirty.setdefault(id, {})
+        data = bytes(data)
+        dirty.pop(add, None)  # A new value replaces the staged one and goes to the back of the order
+        now = time.monotonic()
+        span = range(add, add + len(data))
+        if all(self._known(fetched, a, now) for a in span) and values[span.start:span.stop] == data:
+            self.skipped += 1
+        else:
+            dirty[add] = data
+        return len(dirty)
+
+    # Send the staged payloads of one actuator (or all) in the fewest write frames
+    # Writes go out in the order their first payload was staged, so overlapping registers end up
+    # as written last. True if every write was acknowledged; unacknowledged payloads stay dirty and
+    # their bytes are re-read before use
+    def flush(self, id=None):
+        ok = True
+        for key in ([id] if id is not None else list(self._dirty)):
+            dirty = self._dirty.get(key)
+            if not dirty:
+                continue
+            values, fetched = self._mirror(key)
+            now = time.monotonic()
+            order = {add: i for i, add in enumerate(dirty)}
+            covered = {a for add, data in dirty.items() for a in range(add, add + len(data))}
+            plan = plan_writes(sorted((add, len(data)) for add, data in dirty.items()),
+                               lambda a: a in BRIDGEABLE and a not in covered and self._known(fetched, a, now),
+                               self.max_write)
+            plan.sort(key=lambda write: min(order[a] for a in write[2]))
+            for add, num, parts in plan:
+                data = bytearray(values[add:add + num])
+                for a in parts:
+                    data[a - add:a - add + len(dirty[a])] = dirty[a]
+                self.writes += 1
+                if not self.hand.write_register(key, add, list(data)):
+                    self.invalidate(key, add, num)  # Device state unknown until read again
+                    ok = False
+                    continue
+                values[add:add + num] = data
+                fetched[add:add + num] = [time.monotonic()] * num
+                self.bytes_written += num
+                for a in parts:
+                    del dirty[a]
+        return ok
+
+    # Write register bytes from add through the mirror, True once acknowledged or already in place
+    def write(self, id, add, data):
+        self.stage(id, add, data)
+        return self.flush(id)
+
+    # Write a 16-bit value to one of POSITION_REGISTERS through the mirror
+    def write_position(self, id, name, val):
+        return self.write(id, *position_payload(name, val))
+
+    # Apply {id: {name: value}} settings, True if every actuator acknowledged what had to change
+    # With prefetch the current values are first read in one or two requests per actuator,
+    # so settings the hand already has cost no writes at all
+    def apply(self, config, prefetch=True):
+        ok = True
+        for id, settings in config.items():
+            writes = [register_payload(name, value) for name, value in settings.items()]
+            if prefetch:
+                self.fill(id, [(add, len(data)) for add, data in writes])
+            for add, data in writes:
+                self.stage(id, add, data)
+            ok = self.flush(id) and ok
+        return ok
+
+    # Staged {address: payload} of an actuator that are not yet acknowledged
+    def dirty(self, id):
+        return dict(self._dirty.get(id, {}))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'reads': self.reads, 'bytes_read': self.bytes_read,
+                'writes': self.writes, 'bytes_written': self.bytes_written, 'skipped': self.skipped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the register map of the actuators')
+    parser.add_argument('port')
+    parser.add_argument('--baudrate', type=int, default=921600)
+    parser.add_argument('--ids', type=int, nargs='+', default=[1, 2, 3, 4, 5])
+    parser.add_argument('--set', metavar='NAME=VALUE', action='append', default=[],
+                        help='write a register on every actuator first (unchanged values are not sent)')
+    args = parser.parse_args()
+    settings = {}
+    for item in args.set:
+        name, _, value = item.partition('=')
+        if name not in REGISTERS:
+            parser.error(f"unknown register {name!r}, one of {', '.join(REGISTERS)}")
+        settings[name] = int(value, 0)
+    with Hand.open(args.port, args.baudrate) as hand:
+        cache = RegisterCache(hand)
+        start = time.perf_counter()
+        if settings and not cache.apply({id: settings for id in args.ids}):
+            print('Some writes were not acknowledged')
+        snapshots = {id: cache.snapshot(id) for id in args.ids}
+        elapsed = time.perf_counter() - start
+    print(f"{'register':<16}" + ''.join(f'{f"Actuator {id}":>12}' for id in args.ids))
+    for name in REGISTERS:
+        print(f'{name:<16}' + ''.join(f'{str(snapshots[id][name]):>12}' for id in args.ids))
+    print(f"{cache.reads} reads, {cache.bytes_read} bytes, {cache.writes} writes "
+          f"({cache.skipped} skipped) in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
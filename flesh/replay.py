@@ -0,0 +1,163 @@
+## Replay of recorded sessions (see flesh.recorder)
+## Recorded replies go back through the same FrameDecoder the live client
+## uses and come out as the {id: Status} sweeps update_status() consumes, at
+## the recorded pace, N times faster, or as fast as possible. Seeking is by
+## seconds from the start of the recording, so a grip failure can be replayed
+## from just before it happened, as often as needed, with identical input.
+##
+## python -m flesh.replay endurance --speed 0 prints the replay throughput.
+
+import argparse
+import time
+
+import numpy as np
+
+from flesh.decoder import FrameDecoder
+from flesh.protocol import CMD_MC, QUERY_STATUS, is_status, parse_status
+from flesh.recorder import KIND_COMMAND, KIND_STATUS, RAW_SIZE, load, load_all, segments
+
+BLOCK = 4096                # Records converted to Python objects at a time
+MIN_SLEEP = 0.001           # Frames due sooner than this are delivered without sleeping
+
+
+class Replay:
+    """Plays back a recording.
+
+    speed is the playback rate relative to the recording: 1 for real time,
+    N for N times faster, None or 0 for as fast as possible. Callbacks get
+    recorded time.monotonic() timestamps, so TelemetryRing windows and other
+    analysis see the same timeline as during the recording.
+    """
+
+    def __init__(self, records, speed=1.0, ids=None):
+        self.records = records
+        self.speed = speed
+        self.t = records['t']
+        status = records['id'][records['kind'] == KIND_STATUS]
+        self.ids = tuple(ids) if ids is not None else tuple(int(id) for id in np.unique(status))
+        self.index = 0
+        self.decoder = FrameDecoder()
+        self.frames = 0             # Reply frames decoded so far
+        self.sweeps = 0             # Status sweeps delivered so far
+        self.truncated = 0          # Reply records longer than RAW_SIZE, skipped since their bytes were not all kept
+        self.elapsed = 0.0          # Wall time spent in run()
+
+    # Replay a segment file, or every segment of a recording prefix
+    @classmethod
+    def open(cls, path, **kwargs):
+        return cls(load_all(path) if segments(path) else load(path), **kwargs)
+
+    # Recorded seconds covered by the recording
+    @property
+    def duration(self):
+        return float(self.t[-1] - self.t[0]) if len(self.t) else 0.0
+
+    # Seconds from the start of the recording to the next record
+    @property
+    def position(self):
+        if self.index >= len(self.t):
+            return self.duration
+        return float(self.t[self.index] - self.t[0])
+
+    # Continue from the first record at or after `offset` seconds into the recording
+    def seek(self, offset):
+        if len(self.t):
+            self.index = int(np.searchsorted(self.t, self.t[0] + offset))
+        self.decoder.reset()
+
+    # Play from the current position until the end or `until` seconds into the recording
+    #   on_sweep(statuses, t)  {id: Status or None} once per status sweep, like Hand.status_all()
+    #   on_frame(frame, t)     every decoded reply frame
+    #   on_command(raw, t)     every recorded request frame
+    # Returns the replay statistics, see stats()
+    def run(self, on_sweep=None, on_frame=None, on_command=None, until=None):
+        records = self.records
+        stop = len(records) if until is None else int(np.searchsorted(self.t, self.t[0] + until, 'right'))
+        speed = self.speed or None
+        decoder = self.decoder
+        sweep = {}
+        start = time.monotonic()
+        base = float(self.t[self.index]) if self.index < stop else 0.0
+        frames = self.frames
+        while self.index < stop:
+            block = records[self.index:min(self.index + BLOCK, stop)]
+            times = block['t'].tolist()
+            kinds = block['kind'].tolist()
+            lengths = block['raw_len'].tolist()
+            raws = np.ascontiguousarray(block['raw']).tobytes()
+            for i, t in enumerate(times):
+                if speed is not None:
+                    ahead = start + (t - base) / speed - time.monotonic()
+                    if ahead > MIN_SLEEP:
+                        time.sleep(ahead)
+                raw = raws[i * RAW_SIZE:i * RAW_SIZE + min(lengths[i], RAW_SIZE)]
+                if kinds[i] != KIND_COMMAND and lengths[i] > RAW_SIZE:
+                    self.truncated += 1  # Fed to the decoder it would only count as a checksum error
+                    continue
+                if kinds[i] == KIND_COMMAND:
+                    if on_command is not None:
+                        on_command(raw, t)
+                    # A new status query means the previous sweep is complete
+                    if sweep and raw[4] == CMD_MC and len(raw) > 6 and raw[6] == QUERY_STATUS:
+                        self._deliver(sweep, t, on_sweep)
+                        sweep = {}
+                    continue
+                for frame in decoder.feed(raw):
+                    frames += 1
+                    if on_frame is not None:
+                        on_frame(frame, t)
+                    if is_status(frame):
+                        if frame.id in sweep:
+                            self._deliver(sweep, t, on_sweep)
+                            sweep = {}
+                        sweep[frame.id] = parse_status(frame)
+                        if len(sweep) == len(self.ids):
+                            self._deliver(sweep, t, on_sweep)
+                            sweep = {}
+            self.index += len(block)
+        if sweep:
+            self._deliver(sweep, times[-1], on_sweep)
+        self.elapsed += time.monotonic() - start
+        self.frames = frames
+        return self.stats()
+
+    def _deliver(self, sweep, t, on_sweep):
+        self.sweeps += 1
+        if on_sweep is not None:
+            statuses = dict.fromkeys(self.ids)
+            statuses.update(sweep)
+            on_sweep(statuses, t)
+
+    # Frames, sweeps, decode errors and throughput of the replay so far
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'sweeps': self.sweeps,
+            'checksum_errors': self.decoder.checksum_errors,
+            'truncated': self.truncated,
+            'seconds': self.elapsed,
+            'frames_per_sec': self.frames / self.elapsed if self.elapsed else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a FLESH recording')
+    parser.add_argument('path', help='segment file, or the recording prefix for all segments')
+    parser.add_argument('--speed', type=float, default=0, help='1 for real time, N for N times faster, 0 for as fast as possible')
+    parser.add_argument('--seek', type=float, default=0, help='start this many seconds into the recording')
+    parser.add_argument('--until', type=float, help='stop this many seconds into the recording')
+    args = parser.parse_args()
+
+    from flesh.telemetry import TelemetryRing
+    replay = Replay.open(args.path, speed=args.speed)
+    telemetry = TelemetryRing(ids=replay.ids)
+    replay.seek(args.seek)
+    stats = replay.run(on_sweep=telemetry.record, until=args.until)
+    print(f"Replayed {replay.duration:.3f} s recording from {args.seek:.3f} s: "
+          f"{stats['frames']} frames, {stats['sweeps']} sweeps, {stats['checksum_errors']} checksum errors, "
+          f"{stats['truncated']} truncated replies skipped")
+    print(f"{stats['seconds']:.3f} s, {stats['frames_per_sec']:,.0f} frames/sec")
+
+
+if __name__ == '__main__':
+    main()
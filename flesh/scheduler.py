@@ -0,0 +1,149 @@
+## Drift-free scheduling on absolute monotonic deadlines
+## A loop of send() + time.sleep(period) runs slower than its period by the
+## send time and the sleep overshoot, so long demos and endurance cycles drift
+## in period and phase. Here every deadline is computed from the start time
+## (start + n * period, or the previous deadline + delay), never from "now",
+## so errors do not accumulate. Missed deadlines are detected and either run
+## back to back until the schedule is caught up, or skipped. Lateness, missed
+## ticks and overruns are kept per scheduler and reported to the metrics.
+
+import threading
+import time
+
+from flesh.metrics import METRICS
+
+CATCH_UP = 'catch_up'       # Late ticks run back to back until on schedule again
+SKIP = 'skip'               # Ticks a whole period late are dropped, the next one is on the original grid
+POLICIES = (CATCH_UP, SKIP)
+SPIN_MARGIN = 0.002         # Last stretch before a deadline is slept with time.sleep, finer than Event.wait on some platforms
+LATENESS_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5)  # Seconds
+
+
+class Scheduler:
+    """Runs code on absolute time.monotonic() deadlines.
+
+    every(period, fn) calls fn(tick) at start + tick * period and at(offsets,
+    fn) calls fn(i) at start + offsets[i]. wait(delay) is a drop-in for
+    time.sleep(delay) in scripted sequences that waits until `delay` after
+    the previous deadline rather than after now. stop() (or setting the
+    `stop` event) ends all of them early. Use one Scheduler per thread.
+    """
+
+    def __init__(self, name='schedule', policy=CATCH_UP, stop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy!r}, one of {', '.join(POLICIES)}")
+        self.name = name
+        self.policy = policy
+        self.stopped = stop or threading.Event()
+        self.deadline = None        # Last deadline of wait(), None until the first call
+        self._labels = (('schedule', name),)
+        self.ticks = 0              # Deadlines run
+        self.missed = 0             # Deadlines skipped under the SKIP policy
+        self.overruns = 0           # Ticks that finished after the next deadline had passed
+        self.late_total = 0.0
+        self.late_max = 0.0
+
+    def stop(self):
+        self.stopped.set()
+
+    # Sleep until the deadline, False if stopped first; returns how late the wake-up was otherwise
+    def _sleep_until(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining > SPIN_MARGIN and self.stopped.wait(remaining - SPIN_MARGIN):
+            return False
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        if self.stopped.is_set():
+            return False
+        return time.monotonic() - deadline
+
+    def _observe(self, late):
+        self.ticks += 1
+        self.late_total += late
+        self.late_max = max(self.late_max, late)
+        METRICS.observe('flesh_schedule_lateness_seconds', late, self._labels, LATENESS_BUCKETS)
+
+    # Restart the wait() timeline at now (or at `start`)
+    def reset(self, start=None):
+        self.deadline = time.monotonic() if start is None else start
+
+    # Wait until `delay` seconds after the previous deadline, True unless stopped
+    # A deadline missed by more than `delay` under SKIP moves the timeline to now instead of rushing the next steps
+    def wait(self, delay):
+        if self.deadline is None:
+            self.reset()
+        self.deadline += delay
+        late = self._sleep_until(self.deadline)
+        if late is False:
+            return False
+        if late > delay and self.policy == SKIP:
+            self.missed += 1
+            self.deadline = time.monotonic()
+        self._observe(late)
+        return True
+
+    # Call fn(tick) every `period` seconds from now, tick counting deadlines from 0
+    # Stops after `count` ticks, after `duration` seconds, when fn returns False, or on stop()
+    # Under SKIP the last tick of a counted run is never skipped. Returns stats()
+    def every(self, period, fn, count=None, duration=None):
+        if duration is not None:
+            ticks = int(duration / period + 1e-9) + 1
+            count = ticks if count is None else min(count, ticks)
+        start = time.monotonic()
+        tick = 0
+        while count is None or tick < count:
+            deadline = start + tick * period
+            late = self._sleep_until(deadline)
+            if late is False:
+                break
+            if self.policy == SKIP and late >= period:
+                behind = int(late / period)
+                if count is not None:
+                    behind = min(behind, count - 1 - tick)
+                self.missed += behind
+                tick += behind
+                late -= behind * period
+            self._observe(late)
+            if fn(tick) is False:
+                break
+            tick += 1
+            if time.monotonic() > start + tick * period:
+                self.overruns += 1  # fn ran past the next deadline
+        return self.stats()
+
+    # Call fn(i) at start + offsets[i] for increasing offsets in seconds from now
+    # Same stop rules as every(); under SKIP a late call goes to the newest offset already due
+    # and the ones it passed over count as missed. Returns stats()
+    def at(self, offsets, fn):
+        count = len(offsets)
+        start = time.monotonic()
+        i = 0
+        while i < count:
+            late = self._sleep_until(start + offsets[i])
+            if late is False:
+                break
+            if self.policy == SKIP:
+                now = offsets[i] + late
+                due = i
+                while due + 1 < count and offsets[due + 1] <= now:
+                    due += 1
+                self.missed += due - i
+                late = now - offsets[due]
+                i = due
+            self._observe(late)
+            if fn(i) is False:
+                break
+            i += 1
+            if i < count and time.monotonic() > start + offsets[i]:
+                self.overruns += 1  # fn ran past the next deadline
+        return self.stats()
+
+    def stats(self):
+        return {
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'overruns': self.overruns,
+            'late_mean': self.late_total / self.ticks if self.ticks else 0.0,
+            'late_max': self.late_max,
+        }
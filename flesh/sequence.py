@@ -0,0 +1,248 @@
+## Sequence compiler for scripted motion
+## A routine is written down as data instead of Python loops: a list of steps
+##   {'pose': target}                       jump to a pose (like move())
+##   {'move': target, 'duration': s}        smooth move over s seconds (flesh.trajectory profile)
+##   {'wait': s}                            hold for s seconds
+##   {'repeat': n, 'steps': [...]}          play the inner steps n times
+## where a target is a list of positions or the name of a stored gesture.
+## compile_sequence() turns it ahead of time into the broadcast frames to
+## send and the offset in seconds to send each one at. The compiled stream is
+## saved to and loaded from a compact binary file and played back by a sender
+## loop that only waits for the next deadline and writes the next frame.
+##
+## File layout: a 32-byte header (magic, version, actuators, frame size, frame
+## count, rate) followed by `count` float64 send offsets and `count` frames.
+##
+## python -m flesh.sequence compile dance.json dance.flseq --gestures gestures.csv
+## python -m flesh.sequence play dance.flseq COM10
+
+import argparse
+import csv
+import json
+import struct
+
+import numpy as np
+
+from flesh.scheduler import Scheduler, SKIP
+from flesh.trajectory import DEFAULT_RATE, MIN_JERK, Trajectory, broadcast_frames
+
+MAGIC = b'FLESHSEQ'
+VERSION = 1
+HEADER = struct.Struct('<8sHHHId')  # magic, version, actuators, frame size, count, rate
+HEADER_SIZE = 32
+SUFFIX = '.flseq'
+
+
+# {name: positions} from a gesture CSV (name, position1..position5 per row) as saved by the client
+def load_gestures(path):
+    gestures = {}
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header row
+        for row in reader:
+            if len(row) >= 6:
+                gestures[row[0]] = [int(pos) for pos in row[1:6]]
+    return gestures
+
+
+class CompiledSequence:
+    """Ready-to-write broadcast frames with their send offsets in seconds.
+
+    Frames are views into one immutable buffer and are built once, so the
+    sender loop only waits for a deadline and writes.
+    """
+
+    def __init__(self, times, frames, num, rate=DEFAULT_RATE):
+        self.times = np.asarray(times, dtype='<f8')
+        self.num = num
+        self.rate = rate
+        self.count = len(self.times)
+        self.frame_size = 6 + num * 3
+        self.data = bytes(frames)
+        if len(self.data) != self.count * self.frame_size:
+            raise ValueError(f'{len(self.data)} frame bytes do not make {self.count} frames of {self.frame_size}')
+        view = memoryview(self.data)
+        size = self.frame_size
+        self.frames = [view[i * size:(i + 1) * size] for i in range(self.count)]
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def duration(self):
+        return float(self.times[-1]) if self.count else 0.0
+
+    # Target positions each frame carries, shape (count, num)
+    @property
+    def targets(self):
+        frames = np.frombuffer(self.data, np.uint8).reshape(self.count, self.frame_size).astype(np.int64)
+        return frames[:, 6:-1:3] | frames[:, 7:-1:3] << 8
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.num, self.frame_size, self.count, self.rate).ljust(HEADER_SIZE, b'\0'))
+            f.write(self.times.tobytes())
+            f.write(self.data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, num, frame_size, count, rate = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a compiled FLESH sequence')
+        if version != VERSION or frame_size != 6 + num * 3:
+            raise ValueError(f'{path} has format {version}/{frame_size}, expected {VERSION}/{6 + num * 3}')
+        times = np.frombuffer(data, '<f8', count, HEADER_SIZE)
+        start = HEADER_SIZE + count * 8
+        return cls(times, data[start:start + count * frame_size], num, rate)
+
+    # Call send(frame) at each frame's offset from now until the end, until `stop` is set or
+    # until send returns False. A late sender goes straight to the newest due frame, broadcast
+    # targets are absolute so the ones passed over are not needed. Returns the scheduler stats
+    def play(self, send, stop=None):
+        frames = self.frames
+        return Scheduler('sequence', SKIP, stop).at(self.times.tolist(), lambda i: send(frames[i]))
+
+
+class _Compiler:
+    def __init__(self, gestures, rate, profile):
+        self.gestures = gestures or {}
+        self.rate = rate
+        self.profile = profile
+        self.times = []             # Arrays of send offsets, one per emitted block
+        self.targets = []           # Matching (n, num) target arrays
+        self.t = 0.0
+        self.pose = None
+
+    def target(self, value):
+        if isinstance(value, str):
+            if value not in self.gestures:
+                raise ValueError(f'unknown gesture {value!r}')
+            value = self.gestures[value]
+        return np.asarray(value, dtype=np.int64)
+
+    def emit(self, times, targets):
+        self.times.append(np.asarray(times, dtype=float))
+        self.targets.append(np.asarray(targets, dtype=np.int64).reshape(len(self.times[-1]), -1))
+
+    def steps(self, steps):
+        for step in steps:
+            if 'pose' in step:
+                self.pose = self.target(step['pose'])
+                self.emit([self.t], [self.pose])
+            elif 'move' in step:
+                self.move(self.target(step['move']), float(step['duration']))
+            elif 'wait' in step:
+                self.t += float(step['wait'])
+            elif 'repeat' in step:
+                self.repeat(int(step['repeat']), step['steps'])
+            else:
+                raise ValueError(f'unknown sequence step {step!r}')
+
+    # Sampled trajectory from the current pose, a move without a known start pose is a jump
+    def move(self, target, duration):
+        if self.pose is None or duration <= 0:
+            self.pose = target
+            self.emit([self.t], [target])
+            self.t += max(duration, 0.0)
+            return
+        trajectory = Trajectory([(0.0, self.pose), (duration, target)], self.profile)
+        stream = trajectory.frames(self.rate)
+        offsets = np.arange(len(stream)) * stream.period
+        offsets[-1] = duration
+        self.emit(self.t + offsets, stream.targets)
+        self.pose = target
+        self.t += duration
+
+    # The inner steps are compiled once per distinct start pose (the first pass and the ones after it)
+    # and the rest are copies shifted in time
+    def repeat(self, count, steps):
+        if count <= 0:
+            return
+        first = len(self.times)
+        start, entry_pose = self.t, self.pose
+        self.steps(steps)
+        if count == 1:
+            return
+        if self.pose is not None and entry_pose is not None and np.array_equal(self.pose, entry_pose):
+            body, period, done = slice(first, len(self.times)), self.t - start, 1
+        else:
+            start = self.t
+            second = len(self.times)
+            self.steps(steps)
+            body, period, done = slice(second, len(self.times)), self.t - start, 2
+        if count == done:
+            return
+        times = np.concatenate(self.times[body]) if self.times[body] else np.zeros(0)
+        targets = np.concatenate(self.targets[body]) if self.targets[body] else None
+        shifts = np.arange(1, count - done + 1) * period
+        if targets is not None:
+            self.emit((times[None, :] + shifts[:, None]).ravel(), np.tile(targets, (len(shifts), 1)))
+        self.t = start + (count - done + 1) * period
+
+    def result(self):
+        if not self.times:
+            return np.zeros(0), np.zeros((0, 0), dtype=np.int64)
+        times = np.concatenate(self.times)
+        targets = np.concatenate(self.targets)
+        order = np.argsort(times, kind='stable')
+        times, targets = times[order], targets[order]
+        # A frame due at the same time as the next one is overridden by it before it could act
+        keep = np.ones(len(times), dtype=bool)
+        keep[:-1] = times[:-1] != times[1:]
+        times, targets = times[keep], targets[keep]
+        # A frame repeating the one before it changes nothing on the bus
+        keep = np.ones(len(times), dtype=bool)
+        keep[1:] = np.any(targets[1:] != targets[:-1], axis=1)
+        return times[keep], targets[keep]
+
+
+# Compile a list of steps (see the top of this module) into a CompiledSequence
+# gestures maps names used as targets to positions, start is the pose the hand starts from
+# (without one the first move is a jump)
+def compile_sequence(steps, gestures=None, rate=DEFAULT_RATE, profile=MIN_JERK, start=None):
+    compiler = _Compiler(gestures, rate, profile)
+    if start is not None:
+        compiler.pose = compiler.target(start)
+    compiler.steps(steps)
+    times, targets = compiler.result()
+    if not len(times):
+        raise ValueError('sequence sends no frames')
+    targets = np.clip(targets, 0, 0xFFFF)
+    return CompiledSequence(times, broadcast_frames(targets).tobytes(), targets.shape[1], rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile and play FLESH motion sequences')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('compile', help='compile a JSON list of steps')
+    build.add_argument('source')
+    build.add_argument('output')
+    build.add_argument('--gestures', help='gesture CSV for named targets')
+    build.add_argument('--rate', type=float, default=DEFAULT_RATE, help='frames per second during moves')
+    play = commands.add_parser('play', help='play a compiled sequence on a port')
+    play.add_argument('path')
+    play.add_argument('port')
+    play.add_argument('--baudrate', type=int, default=921600)
+    args = parser.parse_args()
+
+    if args.command == 'compile':
+        with open(args.source) as f:
+            steps = json.load(f)
+        gestures = load_gestures(args.gestures) if args.gestures else None
+        sequence = compile_sequence(steps, gestures, args.rate)
+        sequence.save(args.output)
+        print(f'{len(sequence)} frames over {sequence.duration:.2f} s written to {args.output}')
+        return
+
+    from flesh.client import Hand
+    sequence = CompiledSequence.load(args.path)
+    with Hand.open(args.port, args.baudrate, num=sequence.num) as hand:
+        stats = sequence.play(hand.send_frame)
+    print(f"{stats['ticks']} frames sent, {stats['missed']} skipped, "
+          f"lateness mean {stats['late_mean'] * 1000:.2f} ms, max {stats['late_max'] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
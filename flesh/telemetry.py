@@ -0,0 +1,137 @@
+## Fixed-capacity telemetry history backed by preallocated NumPy arrays
+## Each actuator has its own ring stored twice back to back (a mirrored ring),
+## so the last n samples are always one contiguous slice: windows are views,
+## never copies, and memory stays constant however long the session runs.
+
+import time
+
+import numpy as np
+
+from flesh.poller import ACTUATOR_IDS
+
+TELEMETRY_DTYPE = np.dtype([
+    ('t', 'f8'),            # time.monotonic() timestamp in seconds
+    ('id', 'u1'),
+    ('pos', 'i2'),
+    ('temp', 'i1'),
+    ('current', 'u2'),
+    ('force', 'i2'),
+])
+STAT_FIELDS = ('pos', 'temp', 'current', 'force')
+
+
+class TelemetryRing:
+    """Per-actuator telemetry history.
+
+    Single writer, lock-free readers: the writer fills both mirror slots of a
+    sample before publishing the new count, so readers always see complete
+    samples. Views returned by latest()/window() alias the ring and may be
+    overwritten once `capacity` newer samples arrive; copy them to keep them.
+    """
+
+    def __init__(self, capacity=8192, ids=ACTUATOR_IDS):
+        self.capacity = capacity
+        self.ids = tuple(ids)
+        self._row = {id: row for row, id in enumerate(self.ids)}
+        self._data = np.zeros((len(self.ids), 2 * capacity), dtype=TELEMETRY_DTYPE)
+        self._data['id'] = np.array(self.ids, dtype='u1')[:, None]
+        self._count = [0] * len(self.ids)   # Samples ever written per actuator
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    # Record one sample, status is a flesh.protocol.Status (or any (id, pos, temp, current, force) tuple)
+    def append(self, status, t=None):
+        if t is None:
+            t = time.monotonic()
+        row = self._row[status[0]]
+        count = self._count[row]
+        slot = count % self.capacity
+        data = self._data[row]
+        sample = (t, status[0], status[1], status[2], status[3], status[4])
+        data[slot] = sample
+        data[slot + self.capacity] = sample
+        self._count[row] = count + 1
+
+    # Record a sweep {id: Status or None}, missing actuators are skipped
+    def record(self, statuses, t=None):
+        if t is None:
+            t = time.monotonic()
+        for status in statuses.values():
+            if status is not None:
+                self.append(status, t)
+
+    # Number of samples currently held for an actuator
+    def size(self, id):
+        return min(self._count[self._row[id]], self.capacity)
+
+    # Number of samples ever recorded for an actuator, changes whenever a new one arrives
+    def count(self, id):
+        return self._count[self._row[id]]
+
+    # View of the last n samples of an actuator, oldest first
+    def latest(self, id, n=None):
+        row = self._row[id]
+        count = self._count[row]
+        held = min(count, self.capacity)
+        n = held if n is None else min(n, held)
+        end = count % self.capacity + (self.capacity if count >= self.capacity else 0)
+        return self._data[row, end - n:end]
+
+    # View of the samples of an actuator from the last `ms` milliseconds
+    def window(self, id, ms, now=None):
+        samples = self.latest(id)
+        if now is None:
+            now = time.monotonic()
+        start = np.searchsorted(samples['t'], now - ms / 1000.0)
+        return samples[start:]
+
+    # Mean of a field over the last ms milliseconds for every actuator (NaN when empty)
+    def mean(self, field, ms, now=None):
+        return self._reduce(field, ms, now, lambda w: w[field].mean())
+
+    # Maximum of a field over the last ms milliseconds for every actuator (NaN when empty)
+    def max(self, field, ms, now=None):
+        return self._reduce(field, ms, now, lambda w: w[field].max())
+
+    # Least-squares slope of a field in units per second over the last ms milliseconds (NaN with < 2 samples)
+    def slope(self, field, ms, now=None):
+        def fit(w):
+            if len(w) < 2:
+                return np.nan
+            t = w['t'] - w['t'][-1]
+            y = w[field].astype('f8')
+            t_mean = t.mean()
+            denom = ((t - t_mean) ** 2).sum()
+            return ((t - t_mean) * (y - y.mean())).sum() / denom if denom else np.nan
+        return self._reduce(field, ms, now, fit)
+
+    def _reduce(self, field, ms, now, fn):
+        if field not in STAT_FIELDS:
+            raise ValueError(f"field must be one of {', '.join(STAT_FIELDS)}")
+        if now is None:
+            now = time.monotonic()
+        out = np.full(len(self.ids), np.nan)
+        for row, id in enumerate(self.ids):
+            w = self.window(id, ms, now)
+            if len(w):
+                out[row] = fn(w)
+        return out
+
+
+# Min-max decimation of samples (t sorted) into `width` columns spanning t0..t1 for plotting
+# Returns (columns, values) with the minimum and maximum of every non-empty column, so a
+# spike survives and drawing costs O(width) however many samples there are
+def decimate_minmax(t, y, t0, t1, width):
+    start = np.searchsorted(t, t0)
+    t, y = t[start:], y[start:]
+    if not len(t) or t1 <= t0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=y.dtype)
+    columns = ((t - t0) * (width / (t1 - t0))).astype(np.intp)
+    np.clip(columns, 0, width - 1, out=columns)
+    starts = np.flatnonzero(np.diff(columns, prepend=-1))
+    values = np.empty(2 * len(starts), dtype=y.dtype)
+    values[0::2] = np.minimum.reduceat(y, starts)
+    values[1::2] = np.maximum.reduceat(y, starts)
+    return np.repeat(columns[starts], 2), values
@@ -0,0 +1,110 @@
+## Opt-in frame-level tracer exporting Chrome / Perfetto trace JSON
+## When enabled, every request write, decoded reply, bus transaction and I/O
+## thread command (its wait for the port and its run) is timestamped with the
+## thread it ran on. Load the exported file in chrome://tracing or
+## https://ui.perfetto.dev to see where the time of a gesture went.
+##
+## Disabled (the default) the instrumented code only tests `trace.enabled`.
+## Enable it from code with trace.start() ... trace.export(path), or for a
+## whole run with FLESH_TRACE=out.json python FLESH_client.py.
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+MAX_EVENTS = 1000000        # Oldest events are dropped past this, roughly 150 MB of JSON
+
+enabled = False
+now = time.perf_counter_ns  # Trace clock, nanoseconds
+
+_events = deque(maxlen=MAX_EVENTS)  # (phase, name, category, start_ns, duration_ns, thread id, args)
+_threads = {}               # Thread id -> name, for the track labels
+
+
+def start():
+    global enabled
+    _events.clear()
+    enabled = True
+
+
+def stop():
+    global enabled
+    enabled = False
+
+
+def _record(phase, name, cat, start_ns, duration_ns, args):
+    thread = threading.current_thread()
+    if thread.ident not in _threads:
+        _threads[thread.ident] = thread.name
+    _events.append((phase, name, cat, start_ns, duration_ns, thread.ident, args))
+
+
+# Event that ran from start_ns until now (or end_ns) on the calling thread
+def complete(name, cat, start_ns, end_ns=None, **args):
+    _record('X', name, cat, start_ns, (end_ns or now()) - start_ns, args)
+
+
+# Interval that may overlap others (e.g. commands waiting in a queue), shown on its own async track
+def interval(name, cat, start_ns, end_ns=None, **args):
+    _record('b', name, cat, start_ns, (end_ns or now()) - start_ns, args)
+
+
+# Point event at the current time
+def instant(name, cat, **args):
+    _record('i', name, cat, now(), 0, args)
+
+
+class span:
+    """Context manager recording its body as one event, does nothing while disabled."""
+
+    def __init__(self, name, cat='app', **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = now() if enabled else 0
+        return self
+
+    def __exit__(self, *exc):
+        if self.start and enabled:
+            _record('X', self.name, self.cat, self.start, now() - self.start, self.args)
+
+
+# Number of events recorded since start()
+def count():
+    return len(_events)
+
+
+# Write the recorded events as Chrome trace JSON, returns the number of events written
+def export(path):
+    import json
+    pid = os.getpid()
+    events = list(_events)
+    origin = min((e[3] for e in events), default=0)
+    out = [{'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+           for tid, name in list(_threads.items())]
+    for n, (phase, name, cat, start_ns, duration_ns, tid, args) in enumerate(events):
+        event = {'ph': phase, 'name': name, 'cat': cat, 'pid': pid, 'tid': tid, 'ts': (start_ns - origin) / 1000}
+        if phase == 'X':
+            event['dur'] = duration_ns / 1000
+        elif phase == 'i':
+            event['s'] = 't'
+        if args:
+            event['args'] = args
+        if phase == 'b':
+            event['id'] = n
+            out.append(event)
+            event = {'ph': 'e', 'name': name, 'cat': cat, 'pid': pid, 'tid': tid, 'id': n,
+                     'ts': (start_ns + duration_ns - origin) / 1000}
+        out.append(event)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': out, 'displayTimeUnit': 'ms'}, f)
+    return len(events)
+
+
+if os.environ.get('FLESH_TRACE'):
+    start()
+    atexit.register(export, os.environ['FLESH_TRACE'])
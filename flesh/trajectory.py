@@ -0,0 +1,270 @@
+## Keyframed trajectories streamed as broadcast frames
+## Instead of a step to the final targets (the actuators then run there at full
+## speed), motion is given as keyframes: times and the positions of all
+## actuators. Between keyframes every actuator follows a trapezoidal-velocity
+## or minimum-jerk profile that starts and ends at rest. The profile is
+## evaluated with NumPy for all actuators and all control ticks at once and
+## turned straight into the broadcast frames to send, so a compiled trajectory
+## is cached and playing it again only costs the serial writes.
+##
+## Transitions between poses are two-keyframe trajectories whose duration is
+## stretched until no actuator exceeds its speed limit. A TransitionTable
+## compiles them ahead of time for every pair of stored gestures.
+##
+## python -m flesh.trajectory prints the compile and playback cost of a wave.
+
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from flesh.encoder import BROADCAST_DATA
+from flesh.protocol import TX_HEADER, BROADCAST_ID, CMD_BROADCAST_POS
+from flesh.scheduler import Scheduler, SKIP
+
+TRAPEZOID = 'trapezoid'     # Constant acceleration, cruise, constant deceleration
+MIN_JERK = 'minjerk'        # Smoothest start and stop, 1.875x the mean speed at mid segment
+PROFILES = (TRAPEZOID, MIN_JERK)
+DEFAULT_RATE = 50           # Broadcast frames per second
+ACCEL_FRACTION = 0.25       # Trapezoid: share of a segment spent accelerating, and again decelerating
+DEFAULT_MAX_SPEED = 2500    # Position counts per second, full stroke (1750) in 1.3 s with MIN_JERK
+MIN_DURATION = 0.02         # Shortest transition, one control tick at the default rate
+DEFAULT_SNAP = 20           # Position counts a measured pose may be off a stored one and still use its transitions
+
+
+# Normalised progress 0..1 through a segment at normalised times u (0..1), vectorised
+def profile_shape(u, profile=MIN_JERK, accel=ACCEL_FRACTION):
+    u = np.clip(u, 0.0, 1.0)
+    if profile == MIN_JERK:
+        return u * u * u * (10.0 + u * (-15.0 + 6.0 * u))
+    if profile == TRAPEZOID:
+        peak = 1.0 / (1.0 - accel)  # Cruise speed that still covers the segment
+        return np.where(u < accel, 0.5 * peak * u * u / accel,
+                        np.where(u > 1.0 - accel, 1.0 - 0.5 * peak * (1.0 - u) ** 2 / accel,
+                                 peak * (u - 0.5 * accel)))
+    raise ValueError(f"unknown profile {profile!r}, one of {', '.join(PROFILES)}")
+
+
+# Peak speed of a segment relative to its mean speed (distance / duration)
+def peak_factor(profile=MIN_JERK, accel=ACCEL_FRACTION):
+    if profile == MIN_JERK:
+        return 1.875
+    if profile == TRAPEZOID:
+        return 1.0 / (1.0 - accel)
+    raise ValueError(f"unknown profile {profile!r}, one of {', '.join(PROFILES)}")
+
+
+# Shortest duration moving from start to target that keeps every actuator under its max_speed
+# max_speed is one limit for all actuators or one per actuator, in position counts per second
+def min_duration(start, target, max_speed=DEFAULT_MAX_SPEED, profile=MIN_JERK, accel=ACCEL_FRACTION):
+    distance = np.abs(np.subtract(target, start, dtype=float))
+    return float(np.max(distance * peak_factor(profile, accel) / np.asarray(max_speed, dtype=float)))
+
+
+# Broadcast frames for targets (frames x actuators), one row per frame, built without a Python loop
+def broadcast_frames(targets):
+    targets = np.asarray(targets, dtype=np.int64) & 0xFFFF
+    count, num = targets.shape
+    frames = np.zeros((count, BROADCAST_DATA + num * 3 + 1), dtype=np.uint8)
+    frames[:, :BROADCAST_DATA] = np.frombuffer(TX_HEADER + bytes([1 + num * 3, BROADCAST_ID, CMD_BROADCAST_POS]), np.uint8)
+    frames[:, BROADCAST_DATA:-1:3] = np.arange(1, num + 1, dtype=np.uint8)
+    frames[:, BROADCAST_DATA + 1:-1:3] = targets & 0xFF
+    frames[:, BROADCAST_DATA + 2:-1:3] = targets >> 8
+    frames[:, -1] = frames[:, 2:-1].sum(axis=1, dtype=np.int64) & 0xFF
+    return frames
+
+
+class Trajectory:
+    """Keyframed motion of actuators 1..num.
+
+    keyframes is a sequence of (time, positions) with increasing times in
+    seconds and one position per actuator. Actuators hold the first position
+    until its time and the last one after the end. Trajectories compare and
+    hash by value, so equal ones share a compiled FrameStream.
+    """
+
+    def __init__(self, keyframes, profile=MIN_JERK, accel=ACCEL_FRACTION):
+        if profile not in PROFILES:
+            raise ValueError(f"unknown profile {profile!r}, one of {', '.join(PROFILES)}")
+        if not 0.0 < accel <= 0.5:
+            raise ValueError('accel must be in (0, 0.5]')
+        self.times = np.array([t for t, _ in keyframes], dtype=float)
+        self.positions = np.array([list(p) for _, p in keyframes], dtype=float)
+        if self.positions.ndim != 2 or not len(self.times):
+            raise ValueError('keyframes must be (time, positions) pairs with the same number of positions')
+        if np.any(np.diff(self.times) <= 0):
+            raise ValueError('keyframe times must increase')
+        self.profile = profile
+        self.accel = accel
+        self.key = (tuple(self.times.tolist()), tuple(map(tuple, self.positions.tolist())), profile, accel)
+
+    # Keyframes every `step` seconds from a list of position sets, starting at time 0
+    @classmethod
+    def from_steps(cls, poses, step, **kwargs):
+        return cls([(i * step, pose) for i, pose in enumerate(poses)], **kwargs)
+
+    @property
+    def num(self):
+        return self.positions.shape[1]
+
+    @property
+    def duration(self):
+        return float(self.times[-1])
+
+    def __eq__(self, other):
+        return isinstance(other, Trajectory) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    # Positions at the times t (array), shape (len(t), num), as floats
+    def sample(self, t):
+        t = np.asarray(t, dtype=float)
+        times, positions = self.times, self.positions
+        if len(times) == 1:
+            return np.broadcast_to(positions[0], t.shape + (self.num,)).copy()
+        seg = np.clip(np.searchsorted(times, t, 'right') - 1, 0, len(times) - 2)
+        u = (t - times[seg]) / (times[seg + 1] - times[seg])
+        s = profile_shape(u, self.profile, self.accel)
+        return positions[seg] + s[:, None] * (positions[seg + 1] - positions[seg])
+
+    # Frames for playback at `rate` frames per second, compiled once per trajectory and rate
+    def frames(self, rate=DEFAULT_RATE):
+        return compile_trajectory(self, rate)
+
+
+class FrameStream:
+    """Ready-to-write broadcast frames, one per control tick.
+
+    frame(i) is a view into one immutable buffer, so frames can be handed to
+    other threads (e.g. queued on the I/O worker) without copying.
+    """
+
+    def __init__(self, frames, period, targets=None):
+        self.period = period
+        self.count, self.frame_size = frames.shape
+        self.data = frames.tobytes()
+        self.targets = targets      # (count, num) positions the frames carry, when known
+        self._view = memoryview(self.data)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def duration(self):
+        return (self.count - 1) * self.period
+
+    def frame(self, i):
+        size = self.frame_size
+        return self._view[i * size:(i + 1) * size]
+
+    # Call send(frame) every `period` seconds on a drift-free schedule until the end, until `stop`
+    # is set or until send returns False. A sender that falls behind jumps to the newest due frame
+    # instead of bursting the old ones. Returns the scheduler stats: ticks are the frames sent,
+    # missed the frames skipped
+    def play(self, send, stop=None):
+        scheduler = Scheduler('trajectory', SKIP, stop)
+        return scheduler.every(self.period, lambda i: send(self.frame(i)), self.count)
+
+
+# Trajectory from start to target taking `duration` seconds, or longer where a speed limit needs it
+# (duration None: as fast as the limits allow)
+def transition(start, target, max_speed=DEFAULT_MAX_SPEED, duration=None, profile=MIN_JERK, accel=ACCEL_FRACTION):
+    seconds = max(duration or 0.0, min_duration(start, target, max_speed, profile, accel), MIN_DURATION)
+    return Trajectory([(0.0, start), (seconds, target)], profile, accel)
+
+
+class TransitionTable:
+    """Compiled transitions between every pair of stored poses.
+
+    precompute(poses) compiles them all up front, get(start, target) then
+    returns the cached FrameStream when the measured start pose is within
+    `snap` counts of a stored pose on every actuator, and compiles a
+    transition from the measured pose otherwise. Tables are keyed by pose
+    values, so renaming a gesture keeps its transitions.
+    """
+
+    def __init__(self, max_speed=DEFAULT_MAX_SPEED, duration=None, rate=DEFAULT_RATE,
+                 profile=MIN_JERK, snap=DEFAULT_SNAP):
+        self.max_speed = max_speed
+        self.duration = duration
+        self.rate = rate
+        self.profile = profile
+        self.snap = snap
+        self._poses = np.zeros((0, 0))
+        self._streams = {}          # (start pose, target pose) -> FrameStream
+        self.hits = 0
+        self.misses = 0
+
+    def _compile(self, start, target):
+        return compile_trajectory(transition(start, target, self.max_speed, self.duration, self.profile), self.rate)
+
+    # Compile the transitions between every ordered pair of poses, dropping those of poses no longer given
+    def precompute(self, poses):
+        poses = list(dict.fromkeys(tuple(int(p) for p in pose) for pose in poses))
+        streams = {}
+        for start in poses:
+            for target in poses:
+                if start != target:
+                    key = (start, target)
+                    streams[key] = self._streams.get(key) or self._compile(start, target)
+        self._streams = streams
+        self._poses = np.array(poses, dtype=float)
+        return len(streams)
+
+    # FrameStream from the measured start pose to the target pose
+    def get(self, start, target):
+        target = tuple(int(p) for p in target)
+        if len(self._poses):
+            off = np.max(np.abs(self._poses - np.asarray(start, dtype=float)), axis=1)
+            nearest = int(np.argmin(off))
+            if off[nearest] <= self.snap:
+                stream = self._streams.get((tuple(int(p) for p in self._poses[nearest]), target))
+                if stream is not None:
+                    self.hits += 1
+                    return stream
+        self.misses += 1
+        return self._compile(start, target)
+
+    def __len__(self):
+        return len(self._streams)
+
+
+# Sample a trajectory every 1/rate seconds (plus its end) and build the frames, cached per (trajectory, rate)
+@lru_cache(maxsize=64)
+def compile_trajectory(trajectory, rate=DEFAULT_RATE):
+    period = 1.0 / rate
+    t = np.arange(int(np.floor(trajectory.duration * rate + 1e-9)) + 1) * period
+    if trajectory.duration - t[-1] > 1e-9:
+        t = np.append(t, trajectory.duration)
+    targets = np.clip(np.rint(trajectory.sample(t)), 0, 0xFFFF).astype(np.int64)
+    return FrameStream(broadcast_frames(targets), period, targets)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile and play a test wave')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE)
+    parser.add_argument('--profile', choices=PROFILES, default=MIN_JERK)
+    args = parser.parse_args()
+    wave = [25, 500, 1000, 1500, 1000, 500]
+    trajectory = Trajectory.from_steps([[wave[(i - k) % 6] for k in range(5)] for i in range(13)], 0.2,
+                                       profile=args.profile)
+    start = time.perf_counter()
+    stream = trajectory.frames(args.rate)
+    compiled = time.perf_counter() - start
+    start = time.perf_counter()
+    trajectory.frames(args.rate)
+    cached = time.perf_counter() - start
+    sent = []
+    stats = stream.play(sent.append)
+    bad = sum(bytes(f[:2]) != TX_HEADER or (sum(f[2:-1]) & 0xFF) != f[-1] for f in sent)
+    print(f'{len(stream)} frames over {stream.duration:.2f} s, compiled in {compiled * 1000:.2f} ms, '
+          f'cached lookup {cached * 1e6:.1f} us')
+    print(f"played {stats['ticks']} frames, skipped {stats['missed']}, "
+          f"worst lateness {stats['late_max'] * 1000:.2f} ms, {bad} bad checksums")
+
+
+if __name__ == '__main__':
+    main()
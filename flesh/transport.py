@@ -0,0 +1,115 @@
+## Serial transaction layer for the actuator bus
+## Replaces the flat 10 ms sleep after every command with reads that return
+## as soon as the expected reply has arrived, bounded by a per-command deadline
+
+import time
+import weakref
+
+from flesh import trace
+from flesh.decoder import FrameDecoder
+from flesh.metrics import METRICS
+
+DEFAULT_TIMEOUT = 0.05      # Per-command deadline in seconds (a 22-byte reply takes ~0.25 ms at 921600 baud)
+READ_SLICE = 0.005          # Port read timeout, reads loop against the command deadline in slices this long
+
+
+# Only touch the port timeout when it changes, reconfiguring the port costs a syscall
+# (SetCommState/SetCommTimeouts on Windows), so transactions keep it at a fixed READ_SLICE
+def set_timeout(ser, timeout=READ_SLICE):
+    if ser.timeout != timeout:
+        ser.timeout = timeout
+
+
+_decoders = weakref.WeakKeyDictionary()
+
+
+# The streaming decoder bound to a port, leftover bytes and frames survive between transactions
+def decoder_for(ser):
+    decoder = _decoders.get(ser)
+    if decoder is None:
+        decoder = _decoders[ser] = FrameDecoder()
+    return decoder
+
+
+# Decoder counters of every open port, read by the metrics at scrape time
+def _decoder_totals():
+    decoders = list(_decoders.values())
+    return [
+        ('flesh_frames_total', (), sum(d.frames for d in decoders)),
+        ('flesh_checksum_errors_total', (), sum(d.checksum_errors for d in decoders)),
+        ('flesh_dropped_bytes_total', (), sum(d.dropped_bytes for d in decoders)),
+    ]
+
+
+METRICS.add_collector(_decoder_totals)
+
+
+# Feed the port's decoder until a frame accepted by match arrives or the deadline passes
+# Frames that do not match are parked on the decoder instead of being discarded
+def read_reply(ser, match, deadline):
+    decoder = decoder_for(ser)
+    frame = decoder.take(match)
+    if frame is None:
+        set_timeout(ser)
+    while frame is None:
+        if time.monotonic() >= deadline:
+            if decoder.needed():
+                # Do not leave the next transaction waiting on a frame that never completed
+                METRICS.inc('flesh_short_reads_total')
+                decoder.pending.extend(decoder.skip())
+            return None
+        want = decoder.needed() or 3  # Header and length byte first, then exactly the rest of the frame
+        chunk = ser.read(max(want, ser.in_waiting))
+        if not chunk:
+            continue
+        METRICS.inc('flesh_bytes_in_total', (), len(chunk))
+        for decoded in decoder.feed(chunk):
+            if frame is None and match(decoded):
+                frame = decoded
+            else:
+                decoder.pending.append(decoded)
+    return frame
+
+
+_send_taps = weakref.WeakKeyDictionary()
+
+
+# Call tap(request) for every frame send() writes to this port, e.g. to record commands
+def add_send_tap(ser, tap):
+    _send_taps.setdefault(ser, []).append(tap)
+
+
+def remove_send_tap(ser, tap):
+    taps = _send_taps.get(ser)
+    if taps and tap in taps:
+        taps.remove(tap)
+        if not taps:
+            del _send_taps[ser]
+
+
+# Write a request frame without waiting for a reply (broadcast commands have none)
+def send(ser, request):
+    start = trace.now() if trace.enabled else 0
+    ser.write(request)
+    if start:
+        if len(request) > 4:
+            trace.complete('send', 'bus', start, id=request[3], cmd=request[4], bytes=len(request))
+        else:
+            trace.complete('send', 'bus', start, bytes=len(request))
+    METRICS.inc('flesh_bytes_out_total', (), len(request))
+    if _send_taps:
+        for tap in _send_taps.get(ser, ()):
+            tap(request)
+
+
+# Write a request and return the first decoded reply frame accepted by match, or None on timeout
+# The round-trip time or the timeout is counted per command type and actuator
+def transact_frame(ser, request, match, timeout=DEFAULT_TIMEOUT):
+    start = trace.now() if trace.enabled else 0
+    send(ser, request)
+    sent = time.monotonic()
+    frame = read_reply(ser, match, sent + timeout)
+    METRICS.request(request[4], request[3], frame is not None, time.monotonic() - sent)
+    if start:
+        trace.complete('transact', 'bus', start, id=request[3], cmd=request[4], ok=frame is not None)
+    return frame
@@ -0,0 +1,142 @@
+## Single I/O owner thread with a priority command scheduler
+## One thread owns the serial port. Everyone else submits commands and gets a
+## concurrent.futures.Future for the reply. Stop/safety commands run before
+## motion commands, which run before configuration and telemetry polls.
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from flesh import trace
+from flesh.metrics import METRICS
+
+PRIORITY_STOP = 0           # Stop/safety commands, also cancel queued motion
+PRIORITY_MOTION = 1         # Jogs, gestures, scripted motion
+PRIORITY_CONFIG = 2         # Register reads and writes
+PRIORITY_TELEMETRY = 3      # Status polls
+PRIORITY_NAMES = {PRIORITY_STOP: 'stop', PRIORITY_MOTION: 'motion',
+                  PRIORITY_CONFIG: 'config', PRIORITY_TELEMETRY: 'telemetry'}
+PRIORITY_LABELS = {p: (('priority', name),) for p, name in PRIORITY_NAMES.items()}
+
+
+class QueueStats:
+    """Queue depth and wait time statistics for one priority class."""
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def snapshot(self):
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'max_depth': self.max_depth,
+            'wait_mean_ms': 1000 * self.wait_total / self.completed if self.completed else 0.0,
+            'wait_max_ms': 1000 * self.wait_max,
+        }
+
+
+class IOWorker(threading.Thread):
+    """Owns `device` (a serial port or a flesh.Hand) and runs submitted
+    commands one at a time, most urgent first.
+
+    Commands are callables invoked as fn(device, *args) on the worker thread.
+    """
+
+    def __init__(self, device):
+        super().__init__(name='flesh-io', daemon=True)
+        self.device = device
+        self._heap = []
+        self._seq = itertools.count()  # FIFO order within a priority
+        self._cond = threading.Condition()
+        self._depth = dict.fromkeys(PRIORITY_NAMES, 0)
+        self._stats = {priority: QueueStats() for priority in PRIORITY_NAMES}
+        self._closed = False
+
+    # Queue fn(device, *args) at the given priority and return a Future for its result
+    def submit(self, priority, fn, *args):
+        future = Future()
+        start = trace.now() if trace.enabled else 0
+        with self._cond:
+            if start:
+                trace.complete('queue lock', 'lock', start)
+            if self._closed:
+                raise RuntimeError('I/O worker is shut down')
+            if priority == PRIORITY_STOP:
+                self._cancel_motion()
+            heapq.heappush(self._heap, (priority, next(self._seq), time.monotonic(), fn, args, future))
+            stats = self._stats[priority]
+            stats.submitted += 1
+            self._depth[priority] += 1
+            stats.max_depth = max(stats.max_depth, self._depth[priority])
+            self._cond.notify()
+        return future
+
+    # Drop queued motion commands so nothing moves the hand after a stop (caller holds _cond)
+    def _cancel_motion(self):
+        kept = []
+        for item in self._heap:
+            if item[0] == PRIORITY_MOTION:
+                item[5].cancel()
+                self._depth[PRIORITY_MOTION] -= 1
+                self._stats[PRIORITY_MOTION].cancelled += 1
+            else:
+                kept.append(item)
+        heapq.heapify(kept)
+        self._heap = kept
+
+    # Commands waiting per priority name
+    def depth(self):
+        with self._cond:
+            return {PRIORITY_NAMES[p]: n for p, n in self._depth.items()}
+
+    # Queue statistics per priority name
+    def stats(self):
+        with self._cond:
+            return {PRIORITY_NAMES[p]: s.snapshot() for p, s in self._stats.items()}
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if not self._heap:
+                    return
+                priority, _, queued_at, fn, args, future = heapq.heappop(self._heap)
+                self._depth[priority] -= 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            wait = time.monotonic() - queued_at
+            METRICS.observe('flesh_queue_wait_seconds', wait, PRIORITY_LABELS[priority])
+            start = trace.now() if trace.enabled else 0
+            if start:
+                # Time the command waited for the port, waits overlap so they get async tracks
+                trace.interval(f'wait {PRIORITY_NAMES[priority]}', 'queue', start - int(wait * 1e9), start)
+            try:
+                result = fn(self.device, *args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            if start:
+                trace.complete(getattr(fn, '__qualname__', repr(fn)), 'worker', start, priority=PRIORITY_NAMES[priority])
+            with self._cond:
+                stats = self._stats[priority]
+                stats.completed += 1
+                stats.wait_total += wait
+                stats.wait_max = max(stats.wait_max, wait)
+
+    # Finish the queued commands and stop the thread
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if wait and self.is_alive():
+            self.join()
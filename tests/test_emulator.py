@@ -0,0 +1,303 @@
+## Regression tests against the emulated bus
+## Decoder resync, status polling with lost replies, register write planning
+## and the recorder -> replay round trip, all without hardware.
+##
+## python -m pytest -q tests
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh import trace
+from flesh.client import Hand
+from flesh.decoder import FrameDecoder
+from flesh.emulator import EmulatedPort, HandEmulator
+from flesh.encoder import read_request
+from flesh.poller import AdaptivePoller, poll_status
+from flesh.protocol import CMD_RD, CMD_WR, is_status
+from flesh.recorder import Recorder, load_all
+from flesh.registers import RegisterCache, plan_writes
+from flesh.replay import Replay
+from flesh.transport import add_send_tap, decoder_for, send
+
+IDS = (1, 2, 3, 4, 5)
+
+
+# Requests of one command written to a port, as (address, data length)
+def record_writes(ser, cmd=CMD_WR):
+    writes = []
+    add_send_tap(ser, lambda request: writes.append((request[5], len(request) - 7)) if request[4] == cmd else None)
+    return writes
+
+
+# Replies the emulator has already sent back, decoded and parked like late replies
+def park_replies(ser):
+    time.sleep(0.01)
+    decoder = decoder_for(ser)
+    decoder.pending.extend(decoder.feed(ser.read(ser.in_waiting)))
+
+
+# Decoder
+
+def test_decoder_reassembles_frames_fed_byte_by_byte():
+    emulator = HandEmulator()
+    replies = b''.join(emulator.actuators[id].status_reply() for id in IDS)
+    decoder = FrameDecoder()
+    frames = [frame for i in range(len(replies)) for frame in decoder.feed(replies[i:i + 1])]
+    assert [frame.id for frame in frames] == list(IDS)
+    assert all(is_status(frame) for frame in frames)
+    assert decoder.checksum_errors == 0 and decoder.dropped_bytes == 0
+
+
+def test_decoder_rejects_overlong_length_in_noise():
+    reply = HandEmulator().actuators[1].status_reply()
+    decoder = FrameDecoder()
+    frames = decoder.feed(b'\xAA\x55\xF0' + reply)
+    assert [frame.id for frame in frames] == [1]
+    assert decoder.needed() == 0 and not decoder.buf
+
+
+def test_noise_header_does_not_block_later_transactions():
+    port = EmulatedPort()
+    hand = Hand(port)
+    port.inject(b'\xAA\x55\xF0')  # Line noise that looks like a header with a 240-byte frame
+    assert all(hand.status(1) is not None for _ in range(10))
+
+
+def test_partial_frame_is_dropped_at_the_deadline():
+    port = EmulatedPort()
+    hand = Hand(port, timeout=0.02)
+    port.inject(b'\xAA\x55\x11\x01\x04')  # Start of a reply that never completes
+    assert hand.status(9) is None  # No such actuator, times out on the partial frame
+    assert decoder_for(port).needed() == 0
+    assert hand.status(2).id == 2
+
+
+def test_noisy_bus_never_yields_wrong_statuses():
+    port = EmulatedPort(noise_rate=0.2, corrupt_rate=0.1, seed=3)
+    hand = Hand(port, timeout=0.02)
+    for _ in range(50):
+        for id, status in hand.status_all().items():
+            assert status is None or status.id == id
+    decoder = decoder_for(port)
+    assert decoder.checksum_errors > 0 and decoder.dropped_bytes > 0
+    assert decoder.frames > 200
+
+
+def test_read_reply_of_status_length_is_not_a_status():
+    port = EmulatedPort()
+    send(port, read_request(1, 0, 15))
+    park_replies(port)
+    frame = decoder_for(port).pending[0]
+    assert len(frame.raw) == 22 and frame.cmd == CMD_RD
+    assert not is_status(frame)
+    assert poll_status(port, (1,))[1].temp == 25
+
+
+# Status polling
+
+def test_poll_status_with_dropped_replies():
+    port = EmulatedPort(drop_rate=0.3, seed=1)
+    answered = 0
+    for _ in range(40):
+        statuses = poll_status(port, IDS, timeout=0.01)
+        assert tuple(statuses) == IDS
+        for id, status in statuses.items():
+            assert status is None or status.id == id
+            answered += status is not None
+    assert answered > 150  # The retry recovers most of the 30% lost replies
+
+
+def test_poll_status_without_replies_reports_none():
+    port = EmulatedPort(drop_rate=1.0)
+    start = time.monotonic()
+    assert poll_status(port, IDS, timeout=0.01) == dict.fromkeys(IDS)
+    assert time.monotonic() - start < 0.5
+
+
+def test_poll_status_ignores_late_replies_of_earlier_sweeps():
+    port = EmulatedPort()
+    hand = Hand(port)
+    late = port.emulator.actuators[1].status_reply()  # Sampled at position 0
+    hand.broadcast(900, 0, 0, 0, 0)
+    time.sleep(0.3)
+    decoder = decoder_for(port)
+    decoder.pending.extend(decoder.feed(late))
+    assert poll_status(port, (1,))[1].current_pos > 500
+
+
+def test_poll_status_of_no_ids_writes_nothing():
+    port = EmulatedPort()
+    assert poll_status(port, ()) == {}
+    assert port.bytes_out == 0
+
+
+def test_adaptive_poller_backs_off_after_several_misses():
+    poller = AdaptivePoller(IDS, fast_period=0.02, slow_period=0.5, miss_limit=3, max_backoff=4.0)
+    now = 100.0
+    periods = []
+    for _ in range(7):
+        poller.update({5: None}, now)
+        periods.append(round(poller.next_poll(5) - now, 6))
+    assert periods == [0.02, 0.02, 0.5, 1.0, 2.0, 4.0, 4.0]
+    assert 5 not in poller.active()
+    poller.set_targets([100] * 5, now)  # Back to the first backoff step, not to fast polling
+    assert 5 not in poller.due(now) and poller.next_poll(5) == now + 0.5
+    poller.update({5: None}, now)
+    assert poller.next_poll(5) == now + 1.0
+
+
+def test_adaptive_poller_keeps_moving_finger_fast_through_a_missed_sweep():
+    port = EmulatedPort()
+    poller = AdaptivePoller(IDS, fast_period=0.02, slow_period=0.5)
+    now = 100.0
+    poller.update(poll_status(port), now)
+    poller.set_targets([900] * 5, now)
+    poller.update({1: None}, now)
+    assert 1 in poller.active() and poller.next_poll(1) - now < 0.05
+    poller.update(poll_status(port, (1,)), now)
+    assert 1 in poller.active()
+
+
+def test_trace_of_empty_write(tmp_path):
+    port = EmulatedPort()
+    trace.start()
+    try:
+        send(port, b'')
+        Hand(port).status(1)
+    finally:
+        trace.stop()
+    path = tmp_path / 'trace.json'
+    assert trace.export(str(path)) == trace.count() >= 3
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    assert all({'ph', 'name', 'pid', 'tid'} <= event.keys() for event in events)
+    sends = [event for event in events if event['name'] == 'send']
+    assert sends[0]['ph'] == 'X' and sends[0]['cat'] == 'bus' and sends[0]['args'] == {'bytes': 0}
+    assert sends[1]['args'] == {'id': 1, 'cmd': 0x04, 'bytes': 8}
+    assert all(event['ts'] >= 0 and event['dur'] >= 0 for event in sends)
+    assert any(event['name'] == 'transact' and event['args']['ok'] for event in events)
+
+
+# Register writes
+
+def test_plan_writes_keeps_payloads_whole():
+    known = lambda a: True
+    assert plan_writes([(32, 6)], known) == [(32, 6, [32])]
+    assert plan_writes([(2, 1), (12, 1)], known) == [(2, 11, [2, 12])]
+    assert plan_writes([(2, 1), (12, 1)], lambda a: False) == [(2, 1, [2]), (12, 1, [12])]
+    assert plan_writes([(31, 6), (32, 6)], known) == [(31, 6, [31]), (32, 6, [32])]  # Overlapping registers
+    assert plan_writes([(0, 6), (60, 6)], known, max_write=64) == [(0, 6, [0]), (60, 6, [60])]
+
+
+def test_register_cache_writes_whole_aligned_payloads():
+    port = EmulatedPort()
+    cache = RegisterCache(Hand(port))
+    writes = record_writes(port)
+    registers = port.emulator.actuators[1].registers
+    for value in (600, 700, 956):
+        writes.clear()
+        assert cache.apply({1: {'overCurproSet': value}})
+        assert writes == [(32, 6)]
+        assert registers[32:38] == value.to_bytes(2, 'little') * 3
+    writes.clear()
+    assert cache.apply({1: {'overCurproSet': 956}})
+    assert writes == [] and cache.skipped == 1
+
+
+def test_register_cache_shares_frames_between_neighbours():
+    port = EmulatedPort()
+    cache = RegisterCache(Hand(port))
+    writes = record_writes(port)
+    assert cache.fill(1, [(31, 7)])
+    cache.stage(1, 32, [0x10])
+    cache.stage(1, 34, [0x20])  # The byte between is part of the overCurproSet setting
+    assert cache.flush(1)
+    assert writes == [(32, 3)]
+
+
+def test_register_cache_never_bridges_live_or_unnamed_registers():
+    port = EmulatedPort()
+    cache = RegisterCache(Hand(port))
+    writes = record_writes(port)
+    assert cache.apply({2: {'ID': 2, 'baudrate': 3}})
+    assert writes == [(12, 1)]  # ID already holds 2
+    writes.clear()
+    assert cache.apply({2: {'ID': 7, 'baudrate': 4}})
+    assert writes == [(2, 1), (12, 1)]
+    assert port.emulator.actuators[2].registers[2] == 7 and port.emulator.actuators[2].registers[12] == 4
+    writes.clear()
+    assert cache.apply({1: {'ID': 7, 'tarLocatSet': 500}})
+    assert writes == [(2, 1), (55, 6)]  # curLocat (26) and the settings in between are left alone
+
+
+def test_register_cache_reports_failed_refreshes_as_none():
+    port = EmulatedPort()
+    cache = RegisterCache(Hand(port, timeout=0.01))
+    assert cache.snapshot(1)['curLocat'] == 0
+    port.emulator.drop_rate = 1.0
+    time.sleep(0.06)  # curLocat is a live value and has expired
+    assert cache.get(1, 'curLocat') is None
+    snapshot = cache.snapshot(1)
+    assert snapshot['curLocat'] is None
+    assert snapshot['ID'] == 1  # Static, still valid from the first read
+
+
+def test_register_cache_keeps_unacknowledged_writes_dirty():
+    port = EmulatedPort(drop_rate=1.0)
+    cache = RegisterCache(Hand(port, timeout=0.01))
+    assert not cache.apply({1: {'overCurproSet': 700}}, prefetch=False)
+    assert cache.dirty(1) == {32: (700).to_bytes(2, 'little') * 3}
+
+
+# Recorder -> replay
+
+def test_recorder_replay_round_trip(tmp_path):
+    port = EmulatedPort()
+    hand = Hand(port)
+    live = []
+    prefix = str(tmp_path / 'session')
+    with Recorder(prefix) as recorder:
+        recorder.attach(port)
+        for i in range(50):
+            hand.broadcast(*[i * 10] * 5)
+            live.append(hand.status_all())
+            assert len(hand.read_register(1, 0, 64)) == 64
+    replayed = []
+    frames = []
+    replay = Replay(load_all(prefix), speed=0)
+    stats = replay.run(on_sweep=lambda statuses, t: replayed.append(statuses),
+                       on_frame=lambda frame, t: frames.append(frame.cmd))
+    assert stats['checksum_errors'] == 0 and stats['truncated'] == 0
+    assert frames.count(CMD_RD) == 50
+    assert replayed == live
+
+
+def test_replay_seek_repeats_the_same_input(tmp_path):
+    port = EmulatedPort()
+    hand = Hand(port)
+    prefix = str(tmp_path / 'session')
+    with Recorder(prefix) as recorder:
+        recorder.attach(port)
+        for i in range(20):
+            hand.broadcast(*[i * 50] * 5)
+            hand.status_all()
+            time.sleep(0.005)
+    replay = Replay.open(prefix, speed=0)
+    middle = replay.duration / 2
+    runs = []
+    for _ in range(2):
+        sweeps = []
+        replay.seek(middle)
+        replay.run(on_sweep=lambda statuses, t: sweeps.append((t, statuses)))
+        runs.append(sweeps)
+    assert runs[0] and runs[0] == runs[1]
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
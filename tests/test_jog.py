@@ -0,0 +1,88 @@
+## Jog target coalescing (flesh.jog)
+##
+## python -m pytest -q tests
+
+import os
+import sys
+import time
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.jog import TargetBuffer
+
+
+def test_updates_between_ticks_send_only_the_newest():
+    sent = []
+    buffer = TargetBuffer(sent.append)
+    for pos in range(100, 600, 100):
+        buffer.update([pos] * 5)
+    assert buffer.flush()
+    assert not buffer.flush()
+    assert sent == [(500,) * 5]
+    assert buffer.coalesced == 4
+
+
+def test_key_held_at_end_of_travel_sends_once():
+    sent = []
+    buffer = TargetBuffer(sent.append)
+    for _ in range(3):
+        buffer.update([1775] * 5)  # Every repeat clamps to MAX_POS again
+        buffer.flush()
+    assert sent == [(1775,) * 5]
+
+
+def test_targets_changed_back_before_the_tick_send_nothing():
+    sent = []
+    buffer = TargetBuffer(sent.append)
+    buffer.update([25] * 5)
+    buffer.flush()
+    buffer.update([125] * 5)
+    buffer.update([25] * 5)
+    assert not buffer.flush()
+    assert sent == [(25,) * 5]
+
+
+def test_sync_keeps_stale_jog_targets_off_the_bus():
+    sent = []
+    buffer = TargetBuffer(sent.append)
+    buffer.update([500] * 5)
+    buffer.sync([25] * 5)  # A move() sent these by another path
+    assert not buffer.flush()
+    buffer.update([25] * 5)
+    assert not buffer.flush()
+    assert sent == []
+
+
+def test_send_waits_for_the_previous_one():
+    futures = []
+
+    def send(targets):
+        futures.append((targets, Future()))
+        return futures[-1][1]
+
+    buffer = TargetBuffer(send)
+    buffer.update([100] * 5)
+    assert buffer.flush()
+    buffer.update([200] * 5)
+    assert not buffer.flush()  # The first broadcast is still queued
+    futures[0][1].set_result(None)
+    assert buffer.flush()
+    assert [targets for targets, _ in futures] == [(100,) * 5, (200,) * 5]
+
+
+def test_sender_thread_stops_within_a_tick_of_the_last_update():
+    sent = []
+    buffer = TargetBuffer(lambda targets: sent.append((time.monotonic(), targets)), period=0.01)
+    buffer.start()
+    try:
+        for pos in range(30, 330, 10):
+            buffer.update([pos] * 5)
+            time.sleep(0.002)
+        last = time.monotonic()
+        time.sleep(0.05)
+    finally:
+        buffer.close()
+    assert sent[-1][1] == (320,) * 5
+    assert sent[-1][0] - last < 0.03
+    assert len(sent) < 30
@@ -0,0 +1,86 @@
+## Motion completion futures against the emulated hand (flesh.motion)
+##
+## python -m pytest -q tests
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.client import Hand
+from flesh.emulator import EmulatedPort
+from flesh.motion import REACHED, STALLED, STOPPED, TIMEOUT, MotionTracker, watch
+from flesh.protocol import Status
+
+IDS = (1, 2, 3, 4, 5)
+
+
+# A poll that never gets an answer, as from an unplugged hand
+def silent(ids):
+    return dict.fromkeys(ids)
+
+
+def test_watch_resolves_when_every_actuator_reached_its_target():
+    hand = Hand(EmulatedPort())
+    targets = dict(zip(IDS, (900, 700, 500, 300, 100)))
+    hand.broadcast(*targets.values())
+    result = watch(hand.status_all, targets, timeout=3.0).result(5.0)
+    assert result.reached and result.outcomes == dict.fromkeys(IDS, REACHED)
+    assert all(abs(result.statuses[id].current_pos - targets[id]) <= 10 for id in IDS)
+    assert result.elapsed < 2.0
+
+
+def test_watch_reports_a_finger_gripping_an_object_as_stalled():
+    port = EmulatedPort()
+    port.emulator.actuators[2].contact = 400
+    hand = Hand(port)
+    targets = dict.fromkeys(IDS, 900)
+    hand.broadcast(*targets.values())
+    result = watch(hand.status_all, targets, timeout=3.0).result(5.0)
+    assert result.outcomes[2] == STALLED and not result.reached
+    assert all(result.outcomes[id] == REACHED for id in IDS if id != 2)
+    assert result.statuses[2].current_pos < 450 and result.statuses[2].force > 0
+    assert result.elapsed < 2.0
+
+
+def test_watch_times_out_without_replies():
+    start = time.monotonic()
+    result = watch(silent, dict.fromkeys(IDS, 900), timeout=0.05).result(1.0)
+    assert result.outcomes == dict.fromkeys(IDS, TIMEOUT)
+    assert result.statuses == {} and time.monotonic() - start < 0.5
+
+
+def test_watch_stops_early_on_stop():
+    stop = threading.Event()
+    future = watch(silent, dict.fromkeys(IDS, 900), timeout=5.0, stop=stop)
+    time.sleep(0.03)
+    assert not future.done()
+    stop.set()
+    result = future.result(0.5)
+    assert result.outcomes == dict.fromkeys(IDS, STOPPED)
+
+
+def test_watch_reports_poll_errors_on_the_future():
+    def broken(ids):
+        raise OSError('port closed')
+
+    with pytest.raises(OSError):
+        watch(broken, {1: 900}).result(1.0)
+
+
+def test_tracker_needs_a_rise_in_load_to_call_a_stop_a_stall():
+    def sample(pos, current, force=0):
+        return Status(1, pos, 25, current, force)
+
+    idle = MotionTracker({1: 900}, stall_window=0.1)
+    for i in range(20):
+        idle.update({1: sample(400, 30)}, now=i * 0.01)
+    assert idle.pending() == (1,)  # Parked without load, e.g. a slow start, is not a stall
+    loaded = MotionTracker({1: 900}, stall_window=0.1)
+    for i in range(20):
+        loaded.update({1: sample(400, 30 + 5 * i)}, now=i * 0.01)
+    assert loaded.outcomes == {1: STALLED}
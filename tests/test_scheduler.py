@@ -0,0 +1,93 @@
+## Drift-free deadline scheduling (flesh.scheduler)
+##
+## python -m pytest -q tests
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.scheduler import CATCH_UP, SKIP, Scheduler
+
+
+# fn(tick) recording its ticks and stalling for `stall` seconds on the tick given
+def stalling(ticks, at, stall):
+    def fn(tick):
+        ticks.append(tick)
+        if tick == at:
+            time.sleep(stall)
+    return fn
+
+
+def test_catch_up_runs_every_tick_after_a_stall():
+    ticks = []
+    start = time.monotonic()
+    stats = Scheduler('test', CATCH_UP).every(0.01, stalling(ticks, 2, 0.045), count=10)
+    assert ticks == list(range(10))
+    assert stats['ticks'] == 10 and stats['missed'] == 0 and stats['overruns'] >= 1
+    assert stats['late_max'] >= 0.02
+    assert time.monotonic() - start < 0.2  # The late ticks ran back to back, the end stays on schedule
+
+
+def test_skip_drops_ticks_a_whole_period_late_and_keeps_the_last():
+    ticks = []
+    stats = Scheduler('test', SKIP).every(0.01, stalling(ticks, 2, 0.045), count=10)
+    assert ticks[:3] == [0, 1, 2] and ticks[-1] == 9
+    assert ticks == sorted(set(ticks)) and len(ticks) < 10
+    assert stats['ticks'] == len(ticks) and stats['missed'] == 10 - len(ticks)
+    assert stats['late_max'] < 0.01  # A skipped-to tick is late by less than a period
+
+
+def test_every_stops_on_duration_false_or_stop():
+    ticks = []
+    assert Scheduler().every(0.005, ticks.append, duration=0.02)['ticks'] == 5
+    assert ticks == [0, 1, 2, 3, 4]
+    assert Scheduler().every(0.001, lambda tick: tick < 3)['ticks'] == 4
+    stop = threading.Event()
+    threading.Timer(0.03, stop.set).start()
+    start = time.monotonic()
+    Scheduler(stop=stop).every(0.01, lambda tick: None)
+    assert time.monotonic() - start < 0.1
+
+
+def test_at_follows_offsets_without_drift():
+    times = []
+    start = time.monotonic()
+    stats = Scheduler('test', CATCH_UP).at([0.0, 0.01, 0.03, 0.06], lambda i: times.append(time.monotonic() - start))
+    assert stats['ticks'] == 4
+    for offset, t in zip([0.0, 0.01, 0.03, 0.06], times):
+        assert offset <= t < offset + 0.01
+
+
+def test_at_under_skip_jumps_to_the_newest_due_offset():
+    calls = []
+
+    def fn(i):
+        calls.append(i)
+        if i == 0:
+            time.sleep(0.035)
+
+    stats = Scheduler('test', SKIP).at([0.0, 0.01, 0.02, 0.03, 0.1], fn)
+    assert calls == [0, 3, 4]
+    assert stats['missed'] == 2
+
+
+def test_wait_keeps_a_scripted_sequence_on_its_timeline():
+    scheduler = Scheduler()
+    scheduler.reset()
+    start = scheduler.deadline
+    for _ in range(5):
+        time.sleep(0.003)  # Work between the waits does not push the timeline
+        assert scheduler.wait(0.01)
+    assert time.monotonic() - start == pytest.approx(0.05, abs=0.01)
+    scheduler.stop()
+    assert not scheduler.wait(0.01)
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        Scheduler(policy='burst')
@@ -0,0 +1,94 @@
+## Compiled motion sequences and the .flseq format (flesh.sequence)
+##
+## python -m pytest -q tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.encoder import BroadcastEncoder
+from flesh.sequence import CompiledSequence, compile_sequence, load_gestures
+
+GESTURES = {'open': [25] * 5, 'fist': [1700] * 5, 'point': [1700, 25, 1700, 1700, 1700]}
+WAVE = [
+    {'pose': 'open'},
+    {'wait': 0.2},
+    {'repeat': 3, 'steps': [
+        {'move': 'fist', 'duration': 0.2},
+        {'wait': 0.1},
+        {'move': 'open', 'duration': 0.2},
+    ]},
+]
+
+
+def test_save_load_round_trip(tmp_path):
+    sequence = compile_sequence(WAVE, GESTURES)
+    path = str(tmp_path / 'wave.flseq')
+    sequence.save(path)
+    loaded = CompiledSequence.load(path)
+    assert (loaded.num, loaded.rate, len(loaded)) == (5, sequence.rate, len(sequence))
+    assert loaded.times.tolist() == sequence.times.tolist()
+    assert loaded.data == sequence.data
+    assert [bytes(frame) for frame in loaded.frames] == [bytes(frame) for frame in sequence.frames]
+    assert os.path.getsize(path) == 32 + len(sequence) * (8 + sequence.frame_size)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'gestures.flseq'
+    path.write_bytes(b'Name,Pos1,Pos2,Pos3,Pos4,Pos5\n'.ljust(64, b'\0'))
+    with pytest.raises(ValueError):
+        CompiledSequence.load(str(path))
+
+
+def test_frames_carry_the_compiled_targets():
+    sequence = compile_sequence(WAVE, GESTURES)
+    encoder = BroadcastEncoder(5)
+    for frame, targets in zip(sequence.frames, sequence.targets):
+        assert bytes(frame) == bytes(encoder.encode(targets.tolist()))
+    assert sequence.targets[0].tolist() == GESTURES['open']
+    assert sequence.targets[-1].tolist() == GESTURES['open']
+    assert sequence.duration == pytest.approx(0.2 + 3 * 0.5)
+    assert np.all(np.diff(sequence.times) > 0)
+
+
+def test_repeat_compiles_like_the_unrolled_steps():
+    body = WAVE[2]['steps']
+    repeated = compile_sequence(WAVE, GESTURES)
+    unrolled = compile_sequence(WAVE[:2] + body * 3, GESTURES)
+    assert repeated.data == unrolled.data
+    assert repeated.times == pytest.approx(unrolled.times)
+
+
+def test_repeat_ending_on_another_pose_compiles_like_the_unrolled_steps():
+    body = [{'move': 'fist', 'duration': 0.1}, {'move': 'point', 'duration': 0.1}]
+    repeated = compile_sequence([{'repeat': 4, 'steps': body}], GESTURES, start='open')
+    unrolled = compile_sequence(body * 4, GESTURES, start='open')
+    assert repeated.data == unrolled.data
+    assert repeated.times == pytest.approx(unrolled.times)
+
+
+def test_bad_steps_are_rejected():
+    with pytest.raises(ValueError):
+        compile_sequence([{'pose': 'wave'}], GESTURES)
+    with pytest.raises(ValueError):
+        compile_sequence([{'spin': 1}], GESTURES)
+    with pytest.raises(ValueError):
+        compile_sequence([{'wait': 1.0}], GESTURES)
+
+
+def test_load_gestures_reads_the_client_csv(tmp_path):
+    path = tmp_path / 'gestures.csv'
+    path.write_text('Name,Pos1,Pos2,Pos3,Pos4,Pos5\nfist,1700,1700,1700,1700,1700\nbad,1\n')
+    assert load_gestures(str(path)) == {'fist': [1700] * 5}
+
+
+def test_play_sends_frames_in_order():
+    sequence = compile_sequence([{'pose': 'open'}, {'move': 'fist', 'duration': 0.1}], GESTURES, rate=100)
+    sent = []
+    stats = sequence.play(lambda frame: sent.append(bytes(frame)))
+    assert stats['ticks'] == len(sent) and stats['ticks'] + stats['missed'] == len(sequence)
+    assert sent[0] == bytes(sequence.frames[0]) and sent[-1] == bytes(sequence.frames[-1])
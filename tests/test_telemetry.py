@@ -0,0 +1,67 @@
+## Telemetry ring buffer (flesh.telemetry)
+##
+## python -m pytest -q tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.telemetry import TelemetryRing, decimate_minmax
+
+
+# Status tuple (id, pos, temp, current, force)
+def status(id, pos, force=0):
+    return (id, pos, 25, 100, force)
+
+
+def test_ring_keeps_the_newest_samples_after_wrapping():
+    ring = TelemetryRing(capacity=8, ids=(1, 2))
+    nbytes = ring.nbytes
+    for i in range(21):
+        ring.append(status(1, i), t=float(i))
+    assert ring.count(1) == 21 and ring.size(1) == 8
+    assert ring.latest(1)['pos'].tolist() == list(range(13, 21))
+    assert ring.latest(1, 3)['pos'].tolist() == [18, 19, 20]
+    assert ring.latest(1, 100)['t'].tolist() == [float(i) for i in range(13, 21)]
+    assert ring.size(2) == 0 and len(ring.latest(2)) == 0
+    assert ring.nbytes == nbytes
+
+
+@pytest.mark.parametrize('n', [0, 1, 7, 8, 9, 16, 17])
+def test_latest_is_contiguous_at_every_fill_level(n):
+    ring = TelemetryRing(capacity=8, ids=(1,))
+    for i in range(n):
+        ring.append(status(1, i), t=float(i))
+    latest = ring.latest(1)
+    assert latest['pos'].tolist() == list(range(max(n - 8, 0), n))
+    assert latest.base is not None  # A view of the ring, not a copy
+    assert np.all(latest['id'] == 1)
+
+
+def test_window_and_statistics():
+    ring = TelemetryRing(capacity=16, ids=(1, 2))
+    for i in range(10):
+        ring.record({1: status(1, 100 * i, force=i), 2: None}, t=i * 0.01)
+    now = 0.09
+    assert ring.window(1, 35, now)['pos'].tolist() == [600, 700, 800, 900]
+    assert len(ring.window(2, 35, now)) == 0
+    mean = ring.mean('pos', 35, now)
+    assert mean[0] == 750 and np.isnan(mean[1])
+    assert ring.max('force', 1000, now)[0] == 9
+    assert ring.slope('pos', 1000, now)[0] == pytest.approx(10000)
+    with pytest.raises(ValueError):
+        ring.mean('t', 35, now)
+
+
+def test_decimate_keeps_spikes():
+    t = np.arange(1000) * 0.001
+    y = np.zeros(1000, dtype='i2')
+    y[500] = 900
+    columns, values = decimate_minmax(t, y, 0.0, 1.0, 10)
+    assert len(columns) == 20 and columns.tolist() == sorted(columns.tolist())
+    assert values.max() == 900 and columns[values.argmax()] == 5
+    assert len(decimate_minmax(t, y, 2.0, 3.0, 10)[0]) == 0
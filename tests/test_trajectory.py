@@ -0,0 +1,82 @@
+## Keyframed trajectories compiled to broadcast frames (flesh.trajectory)
+##
+## python -m pytest -q tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.emulator import EmulatedPort
+from flesh.encoder import BroadcastEncoder
+from flesh.protocol import TX_HEADER
+from flesh.trajectory import (MIN_JERK, PROFILES, TRAPEZOID, Trajectory, TransitionTable,
+                              broadcast_frames, compile_trajectory, min_duration, transition)
+from flesh.transport import send
+
+
+def test_broadcast_frames_match_the_encoder_byte_for_byte():
+    rng = np.random.default_rng(0)
+    targets = rng.integers(0, 0x10000, size=(200, 5))
+    encoder = BroadcastEncoder(5)
+    frames = broadcast_frames(targets)
+    for row, frame in zip(targets, frames):
+        assert frame.tobytes() == bytes(encoder.encode(row.tolist()))
+        assert frame[:2].tobytes() == TX_HEADER and (int(frame[2:-1].sum()) & 0xFF) == frame[-1]
+
+
+@pytest.mark.parametrize('profile', PROFILES)
+def test_trajectory_starts_and_ends_on_its_keyframes(profile):
+    trajectory = Trajectory([(0.0, [25] * 5), (0.5, [1000, 800, 600, 400, 200]), (1.0, [25] * 5)], profile)
+    stream = trajectory.frames(50)
+    assert len(stream) == 51 and stream.duration == pytest.approx(1.0)
+    assert stream.targets[0].tolist() == [25] * 5
+    assert stream.targets[25].tolist() == [1000, 800, 600, 400, 200]
+    assert stream.targets[-1].tolist() == [25] * 5
+    assert bytes(stream.frame(25)) == bytes(BroadcastEncoder(5).encode([1000, 800, 600, 400, 200]))
+    # Each segment rises then falls without overshooting its keyframes
+    assert np.all(np.diff(stream.targets[:26, 0]) >= 0) and np.all(np.diff(stream.targets[25:, 0]) <= 0)
+
+
+def test_uneven_duration_still_ends_on_the_last_keyframe():
+    stream = Trajectory([(0.0, [0]), (0.11, [100])]).frames(50)
+    assert len(stream) == 7 and stream.targets[-1].tolist() == [100]
+
+
+def test_equal_trajectories_share_a_compiled_stream():
+    keyframes = [(0.0, [25] * 5), (0.4, [900] * 5)]
+    first = Trajectory(keyframes).frames()
+    assert Trajectory(keyframes).frames() is first
+    assert Trajectory(keyframes, TRAPEZOID).frames() is not first
+    assert compile_trajectory(Trajectory(keyframes), 25) is not first
+
+
+def test_transition_respects_the_speed_limit():
+    start, target = [25] * 5, [25, 25, 1775, 25, 25]
+    trajectory = transition(start, target, max_speed=2500)
+    assert trajectory.duration == pytest.approx(min_duration(start, target, 2500))
+    speeds = np.abs(np.diff(trajectory.sample(np.linspace(0, trajectory.duration, 1001)), axis=0))
+    assert speeds.max() / (trajectory.duration / 1000) <= 2500 * 1.001
+    assert transition(start, target, max_speed=2500, duration=5.0).duration == 5.0
+    assert transition(start, start).duration > 0
+
+
+def test_transition_table_snaps_measured_poses_to_stored_ones():
+    open_hand, fist = [25] * 5, [1700] * 5
+    table = TransitionTable(snap=20)
+    assert table.precompute([open_hand, fist]) == 2
+    stream = table.get([30, 20, 25, 40, 25], fist)
+    assert table.hits == 1 and stream is table.get(open_hand, fist)
+    table.get([100] * 5, fist)  # Too far from any stored pose
+    assert table.misses == 1
+
+
+def test_play_sends_every_frame_to_the_hand():
+    port = EmulatedPort()
+    stream = Trajectory([(0.0, [25] * 5), (0.1, [600] * 5)], MIN_JERK).frames(100)
+    stats = stream.play(lambda frame: send(port, frame))
+    assert stats['ticks'] + stats['missed'] == len(stream)
+    assert port.bytes_out == stats['ticks'] * stream.frame_size
@@ -0,0 +1,86 @@
+## Priority scheduling of the I/O owner thread (flesh.worker)
+##
+## python -m pytest -q tests
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flesh.worker import (IOWorker, PRIORITY_CONFIG, PRIORITY_MOTION, PRIORITY_STOP,
+                          PRIORITY_TELEMETRY)
+
+
+# A worker held busy by a first command until the returned event is set
+def blocked_worker(device=None):
+    worker = IOWorker(device)
+    release = threading.Event()
+    worker.submit(PRIORITY_TELEMETRY, lambda device: release.wait(1.0))
+    worker.start()
+    return worker, release
+
+
+def test_commands_run_most_urgent_first_and_in_order_within_a_priority():
+    ran = []
+    worker, release = blocked_worker()
+    try:
+        futures = [worker.submit(priority, lambda device, name: ran.append(name) or name, name)
+                   for priority, name in ((PRIORITY_TELEMETRY, 'poll'), (PRIORITY_CONFIG, 'read'),
+                                          (PRIORITY_MOTION, 'move 1'), (PRIORITY_MOTION, 'move 2'),
+                                          (PRIORITY_STOP, 'stop'))]
+        release.set()
+        assert futures[-1].result(1.0) == 'stop'
+    finally:
+        release.set()
+        worker.shutdown()
+    assert ran == ['stop', 'read', 'poll']
+    assert all(future.cancelled() for future in futures[2:4])
+
+
+def test_stop_cancels_queued_motion_only():
+    worker, release = blocked_worker()
+    try:
+        moves = [worker.submit(PRIORITY_MOTION, lambda device: 'moved') for _ in range(3)]
+        poll = worker.submit(PRIORITY_TELEMETRY, lambda device: 'polled')
+        assert worker.depth() == {'stop': 0, 'motion': 3, 'config': 0, 'telemetry': 1}
+        stop = worker.submit(PRIORITY_STOP, lambda device: 'stopped')
+        assert worker.depth()['motion'] == 0
+        release.set()
+        assert stop.result(1.0) == 'stopped' and poll.result(1.0) == 'polled'
+        after = worker.submit(PRIORITY_MOTION, lambda device: 'moved')
+        assert after.result(1.0) == 'moved'  # Motion submitted after the stop still runs
+    finally:
+        release.set()
+        worker.shutdown()
+    assert all(move.cancelled() for move in moves)
+    stats = worker.stats()
+    assert stats['motion']['cancelled'] == 3 and stats['motion']['completed'] == 1
+    assert stats['telemetry']['completed'] == 2
+
+
+def test_commands_run_on_the_device_and_report_errors():
+    device = object()
+    worker = IOWorker(device)
+    worker.start()
+    try:
+        assert worker.submit(PRIORITY_CONFIG, lambda d, n: (d, n), 5).result(1.0) == (device, 5)
+        failed = worker.submit(PRIORITY_CONFIG, lambda d: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            failed.result(1.0)
+        assert worker.submit(PRIORITY_CONFIG, lambda d: 'still running').result(1.0) == 'still running'
+    finally:
+        worker.shutdown()
+
+
+def test_shutdown_finishes_queued_commands_and_refuses_new_ones():
+    worker, release = blocked_worker()
+    queued = [worker.submit(PRIORITY_CONFIG, lambda device, i: i, i) for i in range(5)]
+    release.set()
+    worker.shutdown()
+    assert [future.result(0) for future in queued] == list(range(5))
+    assert not worker.is_alive()
+    with pytest.raises(RuntimeError):
+        worker.submit(PRIORITY_CONFIG, lambda device: None)